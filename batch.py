@@ -0,0 +1,157 @@
+'''
+Batch evaluation of every possible river card for a set of hands at once
+with NumPy.  NumPy is optional, when it is not installed AVAILABLE is False
+and callers should stick to evaluating one card at a time.
+
+A river card only changes the non flush strength of a hand through its rank,
+so each hand needs 13 non flush lookups, after which a whole (river cards x
+hands) matrix of strengths is a couple of table gathers.
+'''
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import cards
+
+''' True if NumPy is installed and batch evaluation can be used '''
+AVAILABLE = None != numpy
+
+''' NumPy copies of the evaluator tables, built on first use '''
+_tables = {}
+
+def strengths(hands, board, river):
+    '''
+    Finds the strength of every hand with each river card added to the board
+    @param hands list of hands
+    @param board list of board cards before the river
+    @param river list of possible river cards
+    @return (river cards x hands) array of packed strengths
+    '''
+    return partial_strengths([cards.evaluate_partial(hand.hole + board) for hand in hands], river)
+
+def partial_strengths(partials, river):
+    '''
+    Finds the strength of every evaluator state with each river card added
+    @param partials list of evaluator states (see cards.evaluate_partial)
+    @param river list of possible river cards
+    @return (river cards x states) array of packed strengths
+    '''
+    if (0 == len(_tables)):
+        _tables['bits'] = numpy.array(cards.RANK_BITS, dtype = numpy.int64)
+        _tables['flushes'] = numpy.array(cards.FLUSH_STRENGTHS, dtype = numpy.int64)
+
+    # per state: non flush strength by river rank, rank mask by suit and any
+    # flush already made before the river
+    nonflush = []
+    suited = []
+    made = []
+    for partial in partials:
+        nonflush.append(cards.evaluate_partial_ranks(partial))
+        suited.append(partial[1])
+        made.append(partial[3])
+
+    nonflush = numpy.array(nonflush, dtype = numpy.int64)
+    suited = numpy.array(suited, dtype = numpy.int64)
+    made = numpy.array(made, dtype = numpy.int64)
+
+    ranks = numpy.array([card.rank for card in river], dtype = numpy.int64)
+    suits = numpy.array([card.suit for card in river], dtype = numpy.int64)
+    bits = _tables['bits'][ranks]
+
+    # (hands x river cards) strengths, the best of the non flush hand, the
+    # flush made with the river card and any flush made without it
+    result = nonflush[:, ranks]
+    result = numpy.maximum(result, _tables['flushes'][suited[:, suits] | bits])
+    result = numpy.maximum(result, made[:, None])
+
+    return result.T
+
+def calc_outs(hand_player, hand_opponents, board, river, ahead):
+    '''
+    Finds the river cards that change whether the player is winning
+    @param hand_player the player's hand
+    @param hand_opponents list of opponent hands
+    @param board list of board cards before the river
+    @param river list of possible river cards
+    @param ahead <0 if the player is behind before the river, >=0 otherwise
+    @return list of river cards that are outs
+    '''
+    if (0 == len(river)):
+        return []
+
+    hands = [hand_player]
+    hands.extend(hand_opponents)
+    matrix = strengths(hands, board, river)
+
+    # the player against the best opponent for each river card
+    diff = matrix[:, 0] - matrix[:, 1:].max(axis = 1)
+    if (0 <= ahead):
+        flipped = diff < 0
+    else:
+        flipped = diff >= 0
+
+    return [river[i] for i in numpy.flatnonzero(flipped)]
+
+def calc_runner_outs(turns, cards_left, ahead):
+    '''
+    Finds the turn and river pairs that change whether the player is winning
+    @param turns list of the evaluator states of every hand, with the player's
+                 first, for each turn card
+    @param cards_left list of the cards the turn states are for, the river cards
+                      are taken from the same cards
+    @param ahead <0 if the player is behind on the flop, >=0 otherwise
+    @return list of (turn, river) card pairs that are outs
+    '''
+    count = len(cards_left)
+    if (2 > count):
+        return []
+
+    # (river cards x turn cards x hands) strengths
+    hands = len(turns[0])
+    matrix = partial_strengths([partial for turned in turns for partial in turned], cards_left)
+    matrix = matrix.reshape(count, count, hands)
+
+    # the player against the best opponent for each pair, each pair once
+    diff = matrix[:, :, 0] - matrix[:, :, 1:].max(axis = 2)
+    if (0 <= ahead):
+        flipped = diff < 0
+    else:
+        flipped = diff >= 0
+
+    # by turn then river, the same order as going through the pairs one by one
+    turned, rivers = numpy.nonzero(numpy.triu(flipped.T, 1))
+    return [(cards_left[t], cards_left[r]) for t, r in zip(turned, rivers)]
+
+
+if __name__ == "__main__":
+
+    import random
+
+    # this module again as game sees it, rather than as __main__
+    import game
+
+    if (not AVAILABLE):
+        print 'NumPy is not installed, nothing to check'
+
+    else:
+
+        # the same seeded deals with and without numpy, on the turn and the flop
+        for board, name in [(4, 'turn'), (3, 'flop')]:
+
+            same = True
+            for seed in range(0, 300):
+
+                results = []
+                for available in [True, False]:
+                    game.batch.AVAILABLE = available
+                    random.seed(seed)
+                    a_round = game.Round(0)
+                    a_round.deal(seed % 3 + 1, board)
+                    results.append((a_round.outs, a_round.runner_outs))
+
+                same = same and results[0] == results[1]
+
+            game.batch.AVAILABLE = True
+            print name + ' ' + str(same)
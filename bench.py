@@ -0,0 +1,285 @@
+'''
+Benchmarks of dealing rounds, evaluating hands, storing games and playing
+whole games through the app, with seeded inputs so runs can be compared.
+
+Results are seconds per operation (the best of a few repeats) written out as
+JSON.  Given a baseline from an earlier run, any benchmark slower than the
+baseline by more than the threshold is flagged and the exit status is 1.
+
+    python bench.py [-o results.json] [-b baseline.json] [-t 0.25] [-s seed] [-n scale] [-k filter]
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import batch
+import cards
+import codec
+import game
+
+''' Number of times each benchmark is run, the best run counts '''
+REPEAT = 3
+
+''' Number of inputs each benchmark runs over, before scaling '''
+SIZE = 200
+
+''' Max share a benchmark can be slower than the baseline before it is flagged '''
+THRESHOLD = 0.25
+
+''' Hand rankings benchmarked, by name '''
+RANKINGS = [('high_card', cards.Hand.RANKING_HIGH_CARD)
+          , ('pair', cards.Hand.RANKING_PAIR)
+          , ('two_pair', cards.Hand.RANKING_2_PAIR)
+          , ('three_of_a_kind', cards.Hand.RANKING_3_OF_A_KIND)
+          , ('straight', cards.Hand.RANKING_STRAIGHT)
+          , ('flush', cards.Hand.RANKING_FLUSH)
+          , ('full_house', cards.Hand.RANKING_FULL_HOUSE)
+          , ('four_of_a_kind', cards.Hand.RANKING_4_OF_A_KIND)
+          , ('straight_flush', cards.Hand.RANKING_STRAIGHT_FLUSH)
+          , ('royal_flush', cards.Hand.RANKING_ROYAL_FLUSH)]
+
+''' Number of opponents benchmarked '''
+OPPONENTS = [1, 2, 3]
+
+def measure(function, items, repeat = REPEAT):
+    '''
+    Times a function over a list of inputs
+    @param function function taking one input
+    @param items list of inputs
+    @param repeat number of times to go over the inputs
+    @return best number of seconds per input
+    '''
+    best = None
+    for i in range(0, repeat):
+
+        started = timeit.default_timer()
+        for item in items:
+            function(item)
+        elapsed = timeit.default_timer() - started
+
+        if (None == best or elapsed < best):
+            best = elapsed
+
+    return best / len(items)
+
+def run(seed, scale = 1, only = None):
+    '''
+    Runs every benchmark
+    @param seed seed the inputs of each benchmark are made from
+    @param scale multiplier for the number of inputs
+    @param only run only the benchmarks with names containing this
+    @return dictionary of benchmark name to seconds per operation
+    '''
+    size = max(int(SIZE * scale), 1)
+    results = {}
+
+    # nothing cached between inputs, and every round dealt during the benchmark
+    game.OUTS_CACHE = None
+    game.ROUND_POOL = None
+    game.ROUND_DEALER = None
+
+    benchmarks = [('make', _bench_make), ('calc_ahead', _bench_calc_ahead), ('calc_outs', _bench_calc_outs)
+                , ('flop_outs', _bench_flop_outs), ('new_round', _bench_new_round), ('codec', _bench_codec)
+                , ('endpoint', _bench_endpoint)]
+
+    for prefix, bench in benchmarks:
+        if (None == only or only in prefix):
+            random.seed(seed)
+            for name, seconds in bench(size):
+                if (None == only or only in name):
+                    results[name] = seconds
+
+    return results
+
+def compare(results, baseline, threshold = THRESHOLD):
+    '''
+    Finds the benchmarks that got slower than a baseline
+    @param results dictionary of benchmark name to seconds per operation
+    @param baseline results of an earlier run
+    @param threshold max share a benchmark can be slower by
+    @return list of (name, baseline seconds, seconds) of the benchmarks that regressed
+    '''
+    regressed = []
+    for name in sorted(results.keys()):
+        before = baseline.get(name)
+        if (None != before and results[name] > before * (1 + threshold)):
+            regressed.append((name, before, results[name]))
+
+    return regressed
+
+# BENCHMARKS
+
+def _bench_make(size):
+    '''
+    Hand.make and the legacy make on seven card hands of each ranking
+    '''
+    for name, ranking in RANKINGS:
+        deals = []
+        for i in range(0, size):
+            seven = cards.deal_ranking(ranking)
+            deals.append((cards.Hand(seven[0], seven[1]), seven[2:]))
+
+        yield 'make/' + name, measure(lambda deal: deal[0].make(deal[1]), deals)
+        yield 'make_legacy/' + name, measure(lambda deal: deal[0].make_legacy(deal[1]), deals)
+
+def _bench_calc_ahead(size):
+    '''
+    Round._calc_ahead for each number of opponents
+    '''
+    for opponents in OPPONENTS:
+        rounds = [_prepare_round(opponents) for i in range(0, size)]
+        yield 'calc_ahead/' + str(opponents), measure(lambda a_round: a_round._calc_ahead(), rounds)
+
+def _bench_calc_outs(size):
+    '''
+    Round._calc_outs for each number of opponents, without the outs cache
+    '''
+    for opponents in OPPONENTS:
+        rounds = [_prepare_round(opponents) for i in range(0, size)]
+        yield 'calc_outs/' + str(opponents), measure(lambda a_round: a_round._calc_outs(), rounds)
+
+def _bench_flop_outs(size):
+    '''
+    Dealing flop rounds with turn and runner-runner outs for each number of opponents
+    '''
+    for opponents in OPPONENTS:
+        yield 'flop_outs/' + str(opponents), measure(lambda i: game.Round(0).deal(opponents, 3), range(0, size // 4 or 1))
+
+def _bench_new_round(size):
+    '''
+    Game.new_round including dealing again on common outs, for each number of opponents
+    '''
+    for opponents, multiplier in zip(OPPONENTS, [1, 3, 6]):
+
+        def new_round(i):
+            a_game = game.Game(0)
+            a_game.restore([], 0, multiplier)
+            a_game.new_round()
+
+        yield 'new_round/' + str(opponents), measure(new_round, range(0, size))
+
+def _bench_codec(size):
+    '''
+    Encoding and decoding a whole ten round game, as stored in the game row
+    and as the rounds stored in the round table
+    '''
+    games = []
+    for i in range(0, max(size // 10, 1)):
+
+        a_game = game.Game(i)
+        rounds = []
+        while (0 < a_game.rounds_remaining()):
+            a_round = a_game.new_round()
+            a_game.end_round(random.randint(0, 15))
+            rounds.append(a_round)
+
+        games.append((a_game, rounds, codec.encode_game(a_game), [codec.encode_round(a_round) for a_round in rounds]))
+
+    yield 'codec/encode_game', measure(lambda item: codec.encode_game(item[0]), games)
+    yield 'codec/decode_game', measure(lambda item: codec.decode_game(item[2]), games)
+    yield 'codec/encode_rounds', measure(lambda item: [codec.encode_round(a_round) for a_round in item[1]], games)
+    yield 'codec/decode_rounds', measure(lambda item: [codec.decode_round(data) for data in item[3]], games)
+
+def _bench_endpoint(size):
+    '''
+    Whole games played through the app (new game, then a guess and a new
+    round for every round) against a temporary database, with every round
+    dealt during the request
+    '''
+    folder = tempfile.mkdtemp()
+    os.environ['HOWMANYOUTS_DATABASE'] = os.path.join(folder, 'bench.db')
+
+    try:
+        import howmanyouts
+
+        # background workers would make the timings depend on when they run
+        if (None != game.ROUND_POOL):
+            game.ROUND_POOL.stop()
+            game.ROUND_POOL = None
+
+        if (None != howmanyouts.SPECULATOR):
+            howmanyouts.SPECULATOR.stop()
+            howmanyouts.SPECULATOR = None
+
+        client = howmanyouts.app.test_client()
+        client.get('/')
+
+        def play(i):
+            client.post('/game/new')
+            for played in range(0, game.Game.ROUND_COUNT):
+                client.post('/game/guess/' + str(random.randint(0, 15)))
+                client.get('/game/round')
+
+        yield 'endpoint/game', measure(play, range(0, max(size // 20, 1)), 1)
+        yield 'endpoint/scores', measure(lambda i: client.get('/scores/alltime'), range(0, size))
+
+    finally:
+        shutil.rmtree(folder, True)
+
+# PRIVATE FUNCTIONS
+
+def _prepare_round(opponents):
+    '''
+    Deals a round up to the point of finding the outs, leaving its deck
+    @param opponents number of opponents to deal
+    @return round ready for _calc_ahead and _calc_outs
+    '''
+    deck = cards.Deck()
+    deck.shuffle()
+
+    a_round = game.Round(0)
+    a_round._deck = deck
+    a_round._hand_player = cards.Hand(deck.deal(), deck.deal())
+    a_round._hand_opponents = [cards.Hand(deck.deal(), deck.deal()) for i in range(0, opponents)]
+    a_round._board = [deck.deal() for i in range(0, 4)]
+    a_round._ahead = a_round._calc_ahead()
+
+    return a_round
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'Benchmarks how many outs')
+    parser.add_argument('-o', '--output', help = 'file to write the results to as JSON')
+    parser.add_argument('-b', '--baseline', help = 'results of an earlier run to compare against')
+    parser.add_argument('-t', '--threshold', type = float, default = THRESHOLD, help = 'share slower than the baseline that is flagged')
+    parser.add_argument('-s', '--seed', type = int, default = 1, help = 'seed the inputs are made from')
+    parser.add_argument('-n', '--scale', type = float, default = 1, help = 'multiplier for the number of inputs')
+    parser.add_argument('-k', '--only', help = 'only run benchmarks with names containing this')
+    args = parser.parse_args()
+
+    results = run(args.seed, args.scale, args.only)
+
+    report = {'python'  : platform.python_version()
+            , 'numpy'   : batch.AVAILABLE
+            , 'seed'    : args.seed
+            , 'scale'   : args.scale
+            , 'results' : results}
+
+    if (None != args.output):
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2, sort_keys = True)
+
+    baseline = {}
+    if (None != args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    for name in sorted(results.keys()):
+        line = '%-30s %12.2fus' % (name, results[name] * 1000000)
+        if (name in baseline):
+            line += '  %+7.1f%%' % ((results[name] / baseline[name] - 1) * 100)
+        print line
+
+    regressed = compare(results, baseline, args.threshold)
+    for name, before, after in regressed:
+        print 'REGRESSED ' + name + ' ' + ('%.2fus -> %.2fus' % (before * 1000000, after * 1000000))
+
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import shelve
+import threading
+from time import time
+
+class LRUCache:
+    '''
+    Bounded cache that evicts the least recently used entry once full.
+    Entries can optionally expire after a time to live, and the cache can
+    optionally be backed by a shelve file so entries survive restarts (only
+    one process should open a given file).  The shelf only ever holds the
+    entries in memory, so it is bounded and expires the same way.
+    '''
+
+    def __init__(self, size, ttl = None, path = None):
+        '''
+        Constructs a new empty cache
+        @param size max number of entries kept in memory, 0 disables the cache
+        @param ttl optional number of seconds an entry lives for
+        @param path optional shelve file to back the cache with, whose
+                    unexpired entries are loaded straight away
+        '''
+        self._size = size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+        self._shelf = None
+        if (None != path):
+            self._shelf = shelve.open(path)
+            self._load_shelf()
+
+    def get(self, key, default = None):
+        '''
+        @param key key of the entry
+        @param default value to return if there is no entry
+        @return value of the entry or default if missing or expired
+        '''
+        with self._lock:
+
+            entry = self._entries.pop(key, None)
+
+            if (None != entry and None != self._ttl and entry[1] + self._ttl < time()):
+                self._delete(key)
+                entry = None
+
+            if (None == entry):
+                self._misses += 1
+                return default
+
+            # mark as most recently used
+            self._hits += 1
+            self._store(key, entry)
+            return entry[0]
+
+    def set(self, key, value):
+        '''
+        Adds or replaces an entry, evicting the least recently used entry if
+        the cache is full
+        @param key key of the entry
+        @param value value of the entry
+        '''
+        with self._lock:
+
+            entry = (value, time())
+            self._entries.pop(key, None)
+            self._store(key, entry)
+
+            if (None != self._shelf and key in self._entries):
+                self._shelf[str(key)] = (key, entry)
+
+    def pop(self, key, default = None):
+        '''
+        Removes an entry and returns it, so only one caller can ever get it
+        @param key key of the entry
+        @param default value to return if there is no entry
+        @return value of the entry or default if missing or expired
+        '''
+        with self._lock:
+
+            entry = self._entries.pop(key, None)
+            self._delete(key)
+
+            if (None != entry and None != self._ttl and entry[1] + self._ttl < time()):
+                entry = None
+
+            if (None == entry):
+                self._misses += 1
+                return default
+
+            self._hits += 1
+            return entry[0]
+
+    def remove(self, key):
+        '''
+        Removes an entry if it exists
+        @param key key of the entry
+        '''
+        with self._lock:
+            self._delete(key)
+
+    def clear(self):
+        '''
+        Removes all entries
+        '''
+        with self._lock:
+            self._entries.clear()
+            if (None != self._shelf):
+                self._shelf.clear()
+
+    def close(self):
+        '''
+        Syncs and closes any backing shelf file
+        '''
+        with self._lock:
+            if (None != self._shelf):
+                self._shelf.close()
+                self._shelf = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    # PROPERTIES
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def size(self):
+        return self._size
+
+    # PRIVATE METHODS
+
+    def _store(self, key, entry):
+        '''
+        Puts an entry in memory as the most recently used, evicting the least
+        recently used entries past the size of the cache from memory and the
+        shelf
+        '''
+        if (0 >= self._size):
+            self._delete(key)
+            return
+
+        self._entries[key] = entry
+        while (len(self._entries) > self._size):
+            self._delete(self._entries.popitem(last = False)[0])
+
+    def _load_shelf(self):
+        '''
+        Puts the unexpired entries of the shelf in memory, oldest first so the
+        newest are the ones kept, dropping the rest from the shelf
+        '''
+        for name, (key, entry) in sorted(self._shelf.items(), key = lambda item: item[1][1][1]):
+            if (None != self._ttl and entry[1] + self._ttl < time()):
+                del self._shelf[name]
+            else:
+                self._store(key, entry)
+
+    def _delete(self, key):
+        '''
+        Removes an entry from memory and the shelf
+        '''
+        self._entries.pop(key, None)
+        if (None != self._shelf and str(key) in self._shelf):
+            del self._shelf[str(key)]
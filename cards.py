@@ -1,3 +1,4 @@
+import itertools
 import random
 
 '''
@@ -48,8 +49,13 @@ def compare_hand_rank(hand1, hand2):
     return hand1.compare(hand2)
 
 
-class Card:
-    '''Individual card in a deck'''
+class Card(object):
+    '''
+    Individual card in a deck.  Cards are immutable and there is only ever
+    one of each (see CARDS), shared by every deck, hand and round
+    '''
+
+    __slots__ = ('_rank', '_suit', '_index', '_string')
 
     '''Ranks for cards higher than 10'''
     RANK_ACE        = 14
@@ -63,18 +69,34 @@ class Card:
     SUIT_DIAMOND    = 2
     SUIT_CLUB       = 3
 
-    '''Creates a new card given a value between 0:52'''
-    def __init__(self, value, rank = None, suit = None):
+    '''Gets the card given a value between 0:52, or given its rank and suit'''
+    def __new__(cls, value, rank = None, suit = None):
 
-        if (None != rank and None != suit):
-            self._rank = rank
-            self._suit = suit
-        else:
-            self._rank = ((value % Deck.CARD_COUNT) % Deck.RANK_COUNT) + 2
-            self._suit = value % Deck.SUIT_COUNT
+        if (None == rank or None == suit):
+            rank = ((value % Deck.CARD_COUNT) % Deck.RANK_COUNT) + 2
+            suit = value % Deck.SUIT_COUNT
+
+        return CARDS[(rank - 2) * Deck.SUIT_COUNT + suit]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards cannot be changed')
+
+    def __reduce__(self):
+        return (Card, (0, self._rank, self._suit))
+
+    def __eq__(self, other):
+        return isinstance(other, Card) and self._index == other._index
+
+    def __ne__(self, other):
+        return not self == other
 
+    def __hash__(self):
+        return self._index
 
     def to_string(self):
+        return self._string
+
+    def _format(self):
 
         map_rank = {Card.RANK_ACE   : 'A'
                   , Card.RANK_KING  : 'K'
@@ -105,11 +127,19 @@ class Card:
     def suit(self):
         return self._suit
 
+    @property
+    def index(self):
+        ''' position of the card in CARDS (0-51) '''
+        return self._index
+
 
 
 class Deck:
     '''
-    Standard deck of cards
+    Standard deck of cards, held as a bytearray of indexes into CARDS with
+    the cards not yet dealt after a cursor.  A 52 bit mask (bit n for
+    CARDS[n]) of the cards remaining is kept alongside for set operations
+    against other cards (see to_mask and from_mask)
     '''
 
     ''' number of suits in a deck of cards'''
@@ -121,24 +151,27 @@ class Deck:
     ''' number of cards in a suit'''
     RANK_COUNT = 13
 
+    ''' mask of every card in a deck '''
+    MASK_ALL = (1 << CARD_COUNT) - 1
+
 
     def __init__(self):
         '''
-        Constructs a new unshuffled deck of cards
+        Constructs a new unshuffled deck of cards, held as indexes into CARDS
         '''
-        self._cards = []
+        self._cards = bytearray(DECK_ORDER)
         self._next = 0
         self._last = None
-
-        for i in range(0, Deck.CARD_COUNT):
-            self._cards.append(Card(i))
+        self._mask = Deck.MASK_ALL
 
     '''
-    Randomly shuffles the deck
+    Randomly shuffles the whole deck, including any cards already dealt
+    @param rng random number generator to shuffle with
     '''
-    def shuffle(self):
+    def shuffle(self, rng = random):
         self._next = 0
-        random.shuffle(self._cards)
+        self._mask = Deck.MASK_ALL
+        rng.shuffle(self._cards)
 
     '''
     Deals a card off the top of the deck
@@ -148,22 +181,383 @@ class Deck:
 
         to_deal = None
         if (self._next < Deck.CARD_COUNT):
-            to_deal = self._cards[self._next]
+            index = self._cards[self._next]
+            to_deal = CARDS[index]
+            self._mask &= ~(1 << index)
             self._next += 1
 
         self._last = to_deal
         return to_deal
 
+    def remove(self, cards):
+        '''
+        Takes known cards out of the deck, wherever they are in it, as if
+        they had been dealt.  Cards already dealt are ignored
+        @param cards list of cards to take out
+        '''
+        for card in cards:
+            if (self.contains(card)):
+
+                # swap the card to the top of the deck and deal it
+                at = self._cards.index(chr(card.index), self._next)
+                self._cards[at] = self._cards[self._next]
+                self._cards[self._next] = card.index
+                self._mask &= ~(1 << card.index)
+                self._next += 1
+
     def remaining(self):
         '''
         @return number of cards remaining in the deck
         '''
         return Deck.CARD_COUNT - self._next
 
+    def remaining_cards(self):
+        '''
+        Goes through the cards remaining in the deck, in order, without
+        dealing them.  The deck must not be dealt from while going through it
+        @return iterator over the remaining cards
+        '''
+        return itertools.imap(CARDS.__getitem__, itertools.islice(self._cards, self._next, None))
+
+    def contains(self, card):
+        '''
+        @param card card to look for
+        @return True if the card has not been dealt
+        '''
+        return 0 != self._mask & (1 << card.index)
+
+    @property
+    def mask(self):
+        ''' mask of the cards remaining in the deck '''
+        return self._mask
+
     @property
     def last(self):
         return self._last
 
+
+def _build_cards():
+    '''
+    Builds every card there is
+    @return list of the 52 cards, indexed by (rank - 2) * SUIT_COUNT + suit
+    '''
+    built = []
+    for rank in range(2, Card.RANK_ACE + 1):
+        for suit in range(0, Deck.SUIT_COUNT):
+
+            card = object.__new__(Card)
+            object.__setattr__(card, '_rank', rank)
+            object.__setattr__(card, '_suit', suit)
+            object.__setattr__(card, '_index', len(built))
+            object.__setattr__(card, '_string', Card._format(card))
+            built.append(card)
+
+    return built
+
+''' The one instance of each card '''
+CARDS = _build_cards()
+
+''' Indexes of the cards in the order of a new deck, the order of card values '''
+DECK_ORDER = [Card(value).index for value in range(0, Deck.CARD_COUNT)]
+
+def to_mask(cards):
+    '''
+    @param cards list of cards
+    @return mask of the cards, bit n set for CARDS[n]
+    '''
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.index
+
+    return mask
+
+def from_mask(mask):
+    '''
+    @param mask mask of cards, bit n set for CARDS[n]
+    @return list of the cards in the mask, in CARDS order
+    '''
+    return [card for card in CARDS if mask & (1 << card.index)]
+
+def deal_ranking(ranking, rng = random):
+    '''
+    Deals seven cards making a hand of a ranking, for checking and
+    benchmarking evaluators.  Rare rankings are built around their made
+    cards instead of waiting for a random deal to hit them
+    @param ranking hand ranking wanted
+    @param rng random number generator to deal with
+    @return list of seven cards
+    '''
+    while (True):
+
+        deck = Deck()
+        deck.shuffle(rng)
+
+        made = []
+        suit = rng.randint(0, Deck.SUIT_COUNT - 1)
+        if (Hand.RANKING_ROYAL_FLUSH == ranking):
+            made = [Card(0, rank, suit) for rank in range(10, Card.RANK_ACE + 1)]
+        elif (Hand.RANKING_STRAIGHT_FLUSH == ranking):
+            top = rng.randint(5, Card.RANK_KING)
+            made = [Card(0, rank if 1 < rank else Card.RANK_ACE, suit) for rank in range(top - 4, top + 1)]
+        elif (Hand.RANKING_4_OF_A_KIND == ranking):
+            rank = rng.randint(2, Card.RANK_ACE)
+            made = [Card(0, rank, each) for each in range(0, Deck.SUIT_COUNT)]
+
+        deck.remove(made)
+        seven = made + [deck.deal() for i in range(len(made), 7)]
+        rng.shuffle(seven)
+
+        if (ranking == evaluate(seven) >> STRENGTH_RANKING_SHIFT):
+            return seven
+
+
+'''
+*************
+  EVALUATOR
+*************
+
+Hands are evaluated into a single packed integer strength: the hand ranking
+in the high bits followed by the ranks of the five made cards, four bits each.
+Packed strengths compare the same way Hand.compare compares made hands.
+'''
+
+''' Bits to shift a hand ranking into a packed strength '''
+STRENGTH_RANKING_SHIFT = 20
+
+''' Bit for each card rank in a rank mask, indexed by card rank '''
+RANK_BITS = [0, 0] + [1 << i for i in range(0, Deck.RANK_COUNT)]
+
+''' Prime for each card rank, the product of which identifies a set of ranks '''
+RANK_PRIMES = [0, 0, 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+
+def pack_strength(ranking, ranks):
+    '''
+    Packs a hand ranking and the ranks of the made cards into a strength
+    @param ranking hand ranking (i.e. Hand.RANKING_FLUSH)
+    @param ranks ranks of the made cards, highest priority first
+    @return packed strength
+    '''
+    strength = ranking
+    for i in range(0, 5):
+        strength <<= 4
+        if (i < len(ranks)):
+            strength |= ranks[i]
+
+    return strength
+
+def unpack_strength(strength):
+    '''
+    @param strength packed strength
+    @return hand ranking and list of the ranks of the made cards
+    '''
+    ranks = []
+    for shift in range(16, -4, -4):
+        rank = (strength >> shift) & 0xF
+        if (0 != rank):
+            ranks.append(rank)
+
+    return strength >> STRENGTH_RANKING_SHIFT, ranks
+
+def _mask_ranks(mask):
+    '''
+    @param mask rank mask
+    @return ranks in the mask from highest to lowest
+    '''
+    ranks = []
+    for rank in range(Card.RANK_ACE, 1, -1):
+        if (mask & RANK_BITS[rank]):
+            ranks.append(rank)
+
+    return ranks
+
+def _straight_ranks(mask):
+    '''
+    @param mask rank mask
+    @return ranks of the highest straight in the mask, None if there is not one
+    '''
+    for high in range(Card.RANK_ACE, 5, -1):
+        ranks = range(high, high - 5, -1)
+        if (all(mask & RANK_BITS[rank] for rank in ranks)):
+            return ranks
+
+    # ace can also be at the bottom of a straight
+    ranks = [5, 4, 3, 2, Card.RANK_ACE]
+    if (all(mask & RANK_BITS[rank] for rank in ranks)):
+        return ranks
+
+    return None
+
+def _build_tables():
+    '''
+    Builds the lookup tables for all 13 bit rank masks
+    @return table of straight strengths and table of flush strengths
+    '''
+    straights = [0] * (1 << Deck.RANK_COUNT)
+    flushes = [0] * (1 << Deck.RANK_COUNT)
+
+    for mask in range(0, 1 << Deck.RANK_COUNT):
+
+        ranks = _straight_ranks(mask)
+        if (None != ranks):
+            straights[mask] = pack_strength(Hand.RANKING_STRAIGHT, ranks)
+            ranking = Hand.RANKING_STRAIGHT_FLUSH
+            if (Card.RANK_ACE == ranks[0]):
+                ranking = Hand.RANKING_ROYAL_FLUSH
+            flushes[mask] = pack_strength(ranking, ranks)
+        else:
+            ranks = _mask_ranks(mask)
+            if (5 <= len(ranks)):
+                flushes[mask] = pack_strength(Hand.RANKING_FLUSH, ranks[0:5])
+
+    return straights, flushes
+
+def _evaluate_ranks(ranks):
+    '''
+    Finds the strength of the best non flush hand amongst a list of card ranks
+    @param ranks list of card ranks
+    @return packed strength
+    '''
+    counts = {}
+    mask = 0
+    for rank in ranks:
+        counts[rank] = counts.get(rank, 0) + 1
+        mask |= RANK_BITS[rank]
+
+    # group ranks by most cards first, then by highest rank
+    groups = sorted([(count, rank) for rank, count in counts.items()], reverse=True)
+    singles = sorted(ranks, reverse=True)
+
+    count, top = groups[0]
+    others = [rank for rank in singles if rank != top]
+    pairs = [rank for kind, rank in groups[1:] if kind >= 2]
+    pairs.sort(reverse=True)
+
+    if (4 <= count):
+        return pack_strength(Hand.RANKING_4_OF_A_KIND, [top] * 4 + others[0:1])
+
+    if (3 == count and 0 < len(pairs)):
+        return pack_strength(Hand.RANKING_FULL_HOUSE, [top] * 3 + [pairs[0]] * 2)
+
+    straight = STRAIGHT_STRENGTHS[mask]
+    if (0 != straight):
+        return straight
+
+    if (3 == count):
+        return pack_strength(Hand.RANKING_3_OF_A_KIND, [top] * 3 + others[0:2])
+
+    if (2 == count and 0 < len(pairs)):
+        others = [rank for rank in others if rank != pairs[0]]
+        return pack_strength(Hand.RANKING_2_PAIR, [top] * 2 + [pairs[0]] * 2 + others[0:1])
+
+    if (2 == count):
+        return pack_strength(Hand.RANKING_PAIR, [top] * 2 + others[0:3])
+
+    return pack_strength(Hand.RANKING_HIGH_CARD, singles[0:5])
+
+def evaluate(cards):
+    '''
+    Finds the strength of the best five card hand amongst a list of cards.
+
+    Non flush strengths are cached by the product of the card rank primes,
+    so after warming up an evaluation is a few multiplies and table lookups.
+    @param cards list of cards (i.e. hole cards and board cards)
+    @return packed strength of the best hand, higher is better
+    '''
+    key = 1
+    suited = [0, 0, 0, 0]
+    for card in cards:
+        rank = card.rank
+        key *= RANK_PRIMES[rank]
+        suited[card.suit] |= RANK_BITS[rank]
+
+    strength = _RANKS.get(key)
+    if (None == strength):
+        strength = _evaluate_ranks([card.rank for card in cards])
+        _RANKS[key] = strength
+
+    return max(strength
+             , FLUSH_STRENGTHS[suited[0]]
+             , FLUSH_STRENGTHS[suited[1]]
+             , FLUSH_STRENGTHS[suited[2]]
+             , FLUSH_STRENGTHS[suited[3]])
+
+def evaluate_partial(cards):
+    '''
+    Builds the evaluator state for a list of cards so single cards can be
+    tried on top of it with evaluate_next, without going over the list again
+    @param cards list of cards (i.e. hole cards and the turn board)
+    @return evaluator state for the cards
+    '''
+    key = 1
+    suited = [0, 0, 0, 0]
+    ranks = []
+    for card in cards:
+        rank = card.rank
+        key *= RANK_PRIMES[rank]
+        suited[card.suit] |= RANK_BITS[rank]
+        ranks.append(rank)
+
+    flush = max(FLUSH_STRENGTHS[suited[0]]
+              , FLUSH_STRENGTHS[suited[1]]
+              , FLUSH_STRENGTHS[suited[2]]
+              , FLUSH_STRENGTHS[suited[3]])
+
+    return (key, suited, ranks, flush)
+
+def evaluate_next(partial, card):
+    '''
+    Finds the strength of the best five card hand amongst the cards of an
+    evaluator state plus one more card
+    @param partial evaluator state from evaluate_partial
+    @param card card to add
+    @return packed strength of the best hand, higher is better
+    '''
+    key, suited, ranks, flush = partial
+    rank = card.rank
+    key *= RANK_PRIMES[rank]
+
+    strength = _RANKS.get(key)
+    if (None == strength):
+        strength = _evaluate_ranks(ranks + [rank])
+        _RANKS[key] = strength
+
+    return max(strength, flush, FLUSH_STRENGTHS[suited[card.suit] | RANK_BITS[rank]])
+
+def evaluate_add(partial, card):
+    '''
+    Adds a card to an evaluator state, for trying more cards on top of it
+    @param partial evaluator state from evaluate_partial
+    @param card card to add
+    @return evaluator state for the cards of the state plus the card
+    '''
+    key, suited, ranks, flush = partial
+    rank = card.rank
+
+    suited = list(suited)
+    suited[card.suit] |= RANK_BITS[rank]
+
+    return (key * RANK_PRIMES[rank], suited, ranks + [rank], max(flush, FLUSH_STRENGTHS[suited[card.suit]]))
+
+def evaluate_partial_ranks(partial):
+    '''
+    Finds the strength of the best non flush hand amongst the cards of an
+    evaluator state plus one more card, for each rank the card could be
+    @param partial evaluator state from evaluate_partial
+    @return list of packed strengths indexed by the rank of the added card
+    '''
+    key, suited, ranks, flush = partial
+
+    strengths = [0, 0]
+    for rank in range(2, Card.RANK_ACE + 1):
+        strength = _RANKS.get(key * RANK_PRIMES[rank])
+        if (None == strength):
+            strength = _evaluate_ranks(ranks + [rank])
+            _RANKS[key * RANK_PRIMES[rank]] = strength
+        strengths.append(strength)
+
+    return strengths
+
+
 class Hand:
     '''
     A poker hand consisting made up of hole cards
@@ -190,8 +584,11 @@ class Hand:
         @param hole_card2 second hole card
         '''
         self._hole = [hole_card1, hole_card2]
+        self._combined = None
         self._made = None
         self._rank = None
+        self._strength = None
+        self._partial = None
 
 
 
@@ -204,19 +601,14 @@ class Hand:
         if the passed hand is higher
         '''
 
-        # compare the rank, if the ranks match, compare individual
-        # cards until one is greater than the other
-        if (None == hand or None == hand._rank ):
+        # packed strengths order by rank and then by each made card, so
+        # comparing hands is a single subtraction
+        if (None == hand or None == hand._strength):
             comp = 1
-        elif (None == self._rank):
+        elif (None == self._strength):
             comp = -1
         else:
-            comp = self._rank - hand.rank
-            if (0 == comp):
-                for i in range(0, 5):
-                    comp = compare_card_rank(self._made[i], hand.made[i])
-                    if (0 != comp):
-                        break
+            comp = self._strength - hand._strength
 
         return comp
 
@@ -224,7 +616,21 @@ class Hand:
     def make(self, board):
         '''
         Adds the board cards to the hole cards and then constructs the best
-        five card hand possible.  Stores the made hand and rank.
+        five card hand possible.  Stores the strength and rank, the made hand
+        is picked out the first time it is asked for.
+        @param board list of community/board cards (i.e. the flop/turn/river)
+        '''
+        self._combined = self._hole[:]
+        self._combined.extend(board)
+
+        self._strength = evaluate(self._combined)
+        self._rank = self._strength >> STRENGTH_RANKING_SHIFT
+        self._made = None
+
+    def make_legacy(self, board):
+        '''
+        Original list scanning version of make, kept as a reference for
+        checking the evaluator.  Stores the made hand and rank.
         @param board list of community/board cards (i.e. the flop/turn/river)
         '''
         combined = self._hole[:]
@@ -241,23 +647,47 @@ class Hand:
             or self._make_kind(2, combined[:])         \
             or self._make_kind(1, combined[:])
 
+        self._combined = combined
         self._rank = made[0]
         self._made = made[1]
+        self._strength = pack_strength(self._rank, [card.rank for card in self._made])
+
+    def prepare(self, board):
+        '''
+        Adds the board cards to the hole cards and keeps the evaluator state
+        so the strength with each possible next card can be found quickly
+        with strength_with
+        @param board list of community/board cards (i.e. the flop/turn)
+        '''
+        combined = self._hole[:]
+        combined.extend(board)
+        self._partial = evaluate_partial(combined)
+
+    def strength_with(self, card):
+        '''
+        Strength of the hand with one more board card, must be prepared first
+        @param card next board card (i.e. the river)
+        @return packed strength of the best hand with the card
+        '''
+        return evaluate_next(self._partial, card)
 
     def reset(self):
         '''
         Sets any made hand and rank back to empty, restoring the hand to just
         hole cards
         '''
-        self._rank = None
+        self._combined = None
         self._made = None
+        self._rank = None
+        self._strength = None
+        self._partial = None
 
     def to_string(self):
 
         ret = ''
         comma = False
-        if (None != self._made):
-            for card in self._made:
+        if (None != self.made):
+            for card in self.made:
                 if (comma):
                     ret += ','
 
@@ -282,15 +712,52 @@ class Hand:
 
     @property
     def made(self):
+        if (None == self._made and None != self._strength):
+            self._made = self._pick_made(self._combined, self._strength)
         return self._made
 
     @property
     def rank(self):
         return self._rank
 
+    @property
+    def strength(self):
+        ''' packed strength of the made hand, higher is better '''
+        return self._strength
+
 
     # PRIVATE METHODS
 
+    def _pick_made(self, combined, strength):
+        '''
+        Picks the cards making up an evaluated hand, preferring cards in the
+        same order the list scanning make would have
+        @param combined list of combined hole cards and board cards
+        @param strength packed strength of the hand
+        @return list of the cards making the hand
+        '''
+        ranking, ranks = unpack_strength(strength)
+
+        pool = combined[:]
+        pool.sort(compare_card_rank, reverse=True)
+
+        # flushes must be made out of the suit with 5 or more cards
+        suit = None
+        if (ranking in [Hand.RANKING_FLUSH, Hand.RANKING_STRAIGHT_FLUSH, Hand.RANKING_ROYAL_FLUSH]):
+            counts = [0, 0, 0, 0]
+            for card in pool:
+                counts[card.suit] += 1
+            suit = counts.index(max(counts))
+
+        made = []
+        for rank in ranks:
+            for card in pool:
+                if (rank == card.rank and (None == suit or suit == card.suit)):
+                    made.append(card)
+                    pool.remove(card)
+                    break
+
+        return made
 
     def _make_royal_flush(self, combined):
         '''
@@ -462,6 +929,11 @@ class Hand:
         return False if False == found else [Hand.RANKING_2_PAIR, found]
 
 
+''' Evaluator lookup tables indexed by rank mask, non flush strengths are filled in as they are seen '''
+STRAIGHT_STRENGTHS, FLUSH_STRENGTHS = _build_tables()
+_RANKS = {}
+
+
 if __name__ == "__main__":
 
     # make sure the deck is coooolio
@@ -674,6 +1146,32 @@ if __name__ == "__main__":
     hand.make(combined)
     print '15 ' + str(Hand.RANKING_HIGH_CARD == hand.rank) + ' ' + str(Card.RANK_ACE == hand.made[0].rank)
 
+    # testing the evaluator makes the same hands as the original list scanning
+    same = True
+    for i in range(0, 10000):
+        deck.shuffle()
+        hand1 = Hand(deck.deal(), deck.deal())
+        hand2 = Hand(hand1.hole[0], hand1.hole[1])
+        board = [deck.deal() for j in range(0, 3 + i % 3)]
+        hand1.make(board)
+        hand2.make_legacy(board)
+        same = same and hand1.rank == hand2.rank and hand1.made == hand2.made \
+                    and hand1.strength == hand2.strength
+
+    print '16 ' + str(same)
+
+    # testing strengths sort hands the same way compare does
+    hands = []
+    for i in range(0, 50):
+        deck.shuffle()
+        hand = Hand(deck.deal(), deck.deal())
+        hand.make([deck.deal() for j in range(0, 5)])
+        hands.append(hand)
+
+    ordered = sorted(hands, compare_hand_rank)
+    print '17 ' + str(ordered == sorted(hands, key=lambda hand: hand.strength)) \
+          + ' ' + str(ordered[-1].strength == max(hand.strength for hand in hands))
+
    # print ''
    # print hand.rank
    # for card in hand.made:
@@ -0,0 +1,270 @@
+'''
+Compact binary encoding of a game for storing in the database.  Only what a
+round needs once it has been dealt is kept (hands, board, outs, guess,
+points and times), every card is a single byte and nothing in the data is
+ever executed when decoding.
+
+Layout (little endian):
+    header      magic 'HMO', format version
+    game        id, score, multiplier, rounds played, game over flag
+    rounds      number of rounds encoded (version 2 on, version 1 encodes
+                every round played)
+    each round  id, flags, ahead, draws, hand/board/out counts, guess, points,
+                time started, time ended, then a byte per hand/board/out card,
+                then for a flop round the number of runner-runner outs and
+                two bytes per runner-runner out
+
+Only the rounds the game holds are encoded, which from version 2 is just the
+current round.  Finished rounds are stored on their own with encode_round.
+'''
+
+import struct
+
+import cards
+import game
+
+''' Marks data as an encoded game '''
+MAGIC = 'HMO'
+
+''' Version of the encoding written '''
+VERSION = 2
+
+''' Versions of the encoding that can be read '''
+VERSIONS = [1, 2]
+
+''' Round flags '''
+FLAG_COMPLETE = 1
+FLAG_RUNNER_OUTS = 2
+
+_HEADER = struct.Struct('<3sB')
+_GAME = struct.Struct('<qiHBB')
+_COUNT = struct.Struct('<B')
+_ROUND = struct.Struct('<BBbBBBBiidd')
+_RUNNER_COUNT = struct.Struct('<H')
+
+def encode_card(card):
+    '''
+    @param card card to encode
+    @return byte value (0-51) of the card
+    '''
+    return card.index
+
+def decode_card(value):
+    '''
+    @param value byte value (0-51) of a card
+    @return the card
+    '''
+    if (value >= cards.Deck.CARD_COUNT):
+        raise ValueError('Bad card ' + str(value))
+
+    return cards.CARDS[value]
+
+def encode_game(a_game):
+    '''
+    Encodes a game and all its rounds
+    @param a_game game to encode
+    @return encoded game as a string of bytes
+    '''
+    rounds = a_game.rounds
+    over = 0 < len(rounds) and None == rounds[-1]
+    if (over):
+        rounds = rounds[:-1]
+
+    parts = [_HEADER.pack(MAGIC, VERSION)
+           , _GAME.pack(a_game.id, a_game.score, a_game.multiplier, a_game.played, over)
+           , _COUNT.pack(len(rounds))]
+
+    for a_round in rounds:
+        parts.append(encode_round(a_round))
+
+    return ''.join(parts)
+
+def decode_game(data):
+    '''
+    Decodes a game encoded with encode_game
+    @param data encoded game
+    @return the game
+    @raise ValueError if the data is not an encoded game this version can read
+    '''
+    try:
+        magic, version = _HEADER.unpack_from(data, 0)
+        if (MAGIC != magic or version not in VERSIONS):
+            raise ValueError('Not an encoded game or unknown version')
+
+        id, score, multiplier, played, over = _GAME.unpack_from(data, _HEADER.size)
+        offset = _HEADER.size + _GAME.size
+
+        count = played
+        if (1 < version):
+            count, = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+
+        rounds = []
+        for i in range(0, count):
+            a_round, offset = decode_round(data, offset)
+            rounds.append(a_round)
+
+    except struct.error as e:
+        raise ValueError('Truncated game: ' + str(e))
+
+    if (over):
+        rounds.append(None)
+
+    a_game = game.Game(id)
+    a_game.restore(rounds, score, multiplier, played)
+    return a_game
+
+def encode_round(a_round):
+    '''
+    Encodes a dealt round
+    @param a_round round to encode
+    @return encoded round as a string of bytes
+    '''
+    hands = a_round.get_hands()
+    board = a_round.get_board()
+    outs = a_round.outs
+
+    flags = 0
+    guess = 0
+    points = 0
+    time_ended = 0
+    if (a_round.complete):
+        flags |= FLAG_COMPLETE
+        guess = a_round.guess
+        points = a_round.points or 0
+        time_ended = a_round.time_ended
+
+    values = []
+    for hand in hands:
+        values.extend([encode_card(card) for card in hand.hole])
+    values.extend([encode_card(card) for card in board])
+    values.extend([encode_card(card) for card in outs])
+
+    runner = ''
+    if (None != a_round.runner_outs):
+        flags |= FLAG_RUNNER_OUTS
+        pairs = [encode_card(card) for pair in a_round.runner_outs for card in pair]
+        runner = _RUNNER_COUNT.pack(len(a_round.runner_outs)) + struct.pack(str(len(pairs)) + 'B', *pairs)
+
+    return _ROUND.pack(a_round.id, flags, a_round.ahead, a_round.draws
+                     , len(hands), len(board), len(outs)
+                     , guess, points, a_round.time_started, time_ended) \
+         + struct.pack(str(len(values)) + 'B', *values) \
+         + runner
+
+def decode_round(data, offset = 0):
+    '''
+    Decodes a round encoded with encode_round
+    @param data data containing the encoded round
+    @param offset where the round starts in the data
+    @return the round and the offset just past it
+    '''
+    id, flags, ahead, draws, count_hands, count_board, count_outs, guess, points, time_started, time_ended \
+        = _ROUND.unpack_from(data, offset)
+    offset += _ROUND.size
+
+    count = count_hands * 2 + count_board + count_outs
+    values = [decode_card(value) for value in struct.unpack_from(str(count) + 'B', data, offset)]
+    offset += count
+
+    runner_outs = None
+    if (flags & FLAG_RUNNER_OUTS):
+        count, = _RUNNER_COUNT.unpack_from(data, offset)
+        offset += _RUNNER_COUNT.size
+
+        pairs = [decode_card(value) for value in struct.unpack_from(str(count * 2) + 'B', data, offset)]
+        runner_outs = [(pairs[i], pairs[i + 1]) for i in range(0, count * 2, 2)]
+        offset += count * 2
+
+    hands = []
+    for i in range(0, count_hands):
+        hands.append(cards.Hand(values[i * 2], values[i * 2 + 1]))
+    values = values[count_hands * 2:]
+
+    a_round = game.Round(id)
+    if (flags & FLAG_COMPLETE):
+        a_round.restore(hands, values[:count_board], ahead, values[count_board:], draws
+                      , time_started, time_ended, guess, points, runner_outs = runner_outs)
+    else:
+        a_round.restore(hands, values[:count_board], ahead, values[count_board:], draws, time_started
+                      , runner_outs = runner_outs)
+
+    return a_round, offset
+
+
+if __name__ == "__main__":
+
+    # an in progress game survives a round trip
+    a_game = game.Game(42)
+    a_game.new_round()
+    a_game.end_round(3)
+    a_game.new_round()
+
+    data = encode_game(a_game)
+    decoded = decode_game(data)
+    print '0 ' + str(data == encode_game(decoded)) + ' ' + str(42 == decoded.id) + ' ' + str(2 == decoded.played)
+    print '1 ' + str(a_game.score == decoded.score) + ' ' + str(a_game.multiplier == decoded.multiplier)
+
+    a_round = a_game.get_cur_round()
+    copy = decoded.get_cur_round()
+    print '2 ' + str([hand.hole for hand in a_round.get_hands()] == [hand.hole for hand in copy.get_hands()]) \
+        + ' ' + str(a_round.get_board() == copy.get_board()) + ' ' + str(a_round.outs == copy.outs) \
+        + ' ' + str(a_round.ahead == copy.ahead) + ' ' + str(False == copy.complete)
+
+    # a finished game keeps its last round and that it is over
+    while (0 < a_game.rounds_remaining()):
+        a_game.end_round(3)
+        a_game.new_round()
+    a_game.end_round(3)
+
+    data = encode_game(a_game)
+    decoded = decode_game(data)
+    print '3 ' + str(data == encode_game(decoded)) + ' ' + str(None == decoded.get_cur_round()) \
+        + ' ' + str(0 == decoded.rounds_remaining()) + ' ' + str(a_game.score == decoded.score)
+
+    # a finished round keeps the guess and points
+    a_round = a_game.rounds[-2]
+    copy = decoded.rounds[-2]
+    print '4 ' + str(copy.complete) + ' ' + str(a_round.guess == copy.guess) + ' ' + str(a_round.points == copy.points) \
+        + ' ' + str(a_round.time_ended == copy.time_ended)
+
+    # a flop round keeps its runner-runner outs
+    a_round = game.Round(0)
+    a_round.deal(2, 3)
+    data = encode_round(a_round)
+    copy, offset = decode_round(data)
+    print '5 ' + str(a_round.runner_outs == copy.runner_outs) + ' ' + str(None != copy.runner_outs) \
+        + ' ' + str(a_round.outs == copy.outs) + ' ' + str(len(data) == offset)
+
+    # a turn round has no runner-runner outs
+    a_round = game.Round(0)
+    a_round.deal(1)
+    copy, offset = decode_round(encode_round(a_round))
+    print '6 ' + str(None == copy.runner_outs) + ' ' + str(a_round.outs == copy.outs)
+
+    # version 1 encoded every round played, without a count
+    a_game = game.Game(7)
+    rounds = []
+    for i in range(0, 3):
+        rounds.append(a_game.new_round())
+        a_game.end_round(3)
+
+    data = _HEADER.pack(MAGIC, 1) + _GAME.pack(7, a_game.score, a_game.multiplier, 3, False) \
+         + ''.join([encode_round(a_round) for a_round in rounds])
+    decoded = decode_game(data)
+    print '7 ' + str(3 == len(decoded.rounds)) + ' ' + str(3 == decoded.played) + ' ' + str(a_game.score == decoded.score) \
+        + ' ' + str([a_round.outs for a_round in rounds] == [a_round.outs for a_round in decoded.rounds])
+
+    # truncated or foreign data is refused
+    data = encode_game(a_game)
+    refused = []
+    for bad in [data[:len(data) - 1], data[:_HEADER.size + 2], '', 'not a game at all'
+              , _HEADER.pack(MAGIC, VERSION + 1) + data[_HEADER.size:]
+              , data[:len(data) - 1] + chr(cards.Deck.CARD_COUNT)]:
+        try:
+            decode_game(bad)
+            refused.append(False)
+        except ValueError:
+            refused.append(True)
+
+    print '8 ' + ' '.join([str(result) for result in refused])
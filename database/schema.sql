@@ -1,21 +1,55 @@
 
-CREATE TABLE game (
+CREATE TABLE IF NOT EXISTS game (
 	
 	data			BLOB		DEFAULT NULL,
 	completed		INTEGER		DEFAULT 0 NOT NULL,
 	score			INTEGER		DEFAULT 0 NOT NULL,
 	name			TEXT		DEFAULT 'Anon' NOT NULL,
 	time_start		INTEGER		NOT NULL,
-	time_completed	INTEGER		DEFAULT NULL
+	time_completed	INTEGER		DEFAULT NULL,
+	version			INTEGER		DEFAULT 0 NOT NULL
 );
 
-CREATE INDEX idx_score ON game(time_completed, score);
+CREATE INDEX IF NOT EXISTS idx_score ON game(time_completed, score);
 
 
-CREATE TABLE hiscores (
+CREATE TABLE IF NOT EXISTS hiscores (
 	
 	game_id			INTEGER		NOT NULL,
 	period			INTEGER		NOT NULL DEFAULT 0,
 
 	PRIMARY KEY(game_id, period)
 );
+
+
+CREATE TABLE IF NOT EXISTS leaderboard (
+
+	period			INTEGER		NOT NULL,
+	game_id			INTEGER		NOT NULL,
+	name			TEXT		NOT NULL,
+	score			INTEGER		NOT NULL,
+
+	PRIMARY KEY(period, game_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_leaderboard_score ON leaderboard(period, score);
+
+
+CREATE TABLE IF NOT EXISTS score_tree (
+
+	period			INTEGER		NOT NULL,
+	node			INTEGER		NOT NULL,
+	count			INTEGER		DEFAULT 0 NOT NULL,
+
+	PRIMARY KEY(period, node)
+);
+
+
+CREATE TABLE IF NOT EXISTS round (
+
+	game_id			INTEGER		NOT NULL,
+	id			INTEGER		NOT NULL,
+	data			BLOB		NOT NULL,
+
+	PRIMARY KEY(game_id, id)
+);
@@ -0,0 +1,115 @@
+import multiprocessing
+import random
+import threading
+
+import codec
+import game
+
+def _start_worker():
+    '''
+    Gives each worker process its own shuffles, as forked workers start with
+    the random state of the process that forked them
+    '''
+    random.seed()
+
+def _deal(opponents):
+    '''
+    Deals a round in a worker process
+    @param opponents number of opponents to deal
+    @return encoded round, or None if it could not be dealt
+    '''
+    try:
+        return codec.encode_round(game.Game.deal_round(opponents))
+    except Exception as e:
+        print 'Error dealing round: ' + repr(e)
+        return None
+
+class ProcessDealer:
+    '''
+    Deals rounds in a pool of worker processes, so dealing and finding the
+    outs of a round (all CPU and all under the GIL) is spread across every
+    core instead of holding up the thread of the request that needs it.
+    Rounds come back from the workers encoded with codec.encode_round.
+
+    A round that takes longer than the timeout to come back, or a worker that
+    fails, gets None so the caller can deal the round itself, as does asking
+    while every worker is busy.  A round trip to a worker costs more than
+    dealing a turn round, so the timeout is kept to tens of milliseconds.
+    '''
+
+    ''' Max number of seconds to wait on a worker for a round '''
+    TIMEOUT = .05
+
+    def __init__(self, processes = None, timeout = TIMEOUT):
+        '''
+        Constructs a new dealer, without any workers until started
+        @param processes number of worker processes, defaults to the number of cores
+        @param timeout max number of seconds to wait on a worker for a round
+        '''
+        self._processes = processes or multiprocessing.cpu_count()
+        self._timeout = timeout
+        self._pool = None
+
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def deal(self, opponents):
+        '''
+        Deals a round the same way Game.deal_round does, in a worker process
+        @param opponents number of opponents to deal
+        @return dealt round, or None if the workers could not deal it in time
+        '''
+        if (None == self._pool):
+            return None
+
+        # rounds given up on still hold a worker until they are dealt
+        with self._lock:
+            if (self._busy >= self._processes):
+                return None
+            self._busy += 1
+
+        try:
+            data = self._pool.apply_async(_deal, (opponents,), callback = self._done).get(self._timeout)
+        except multiprocessing.TimeoutError:
+            return None
+        except Exception as e:
+            print 'Error dealing round: ' + repr(e)
+            return None
+
+        if (None == data):
+            return None
+
+        a_round, offset = codec.decode_round(data)
+        return a_round
+
+    def start(self):
+        '''
+        Starts the worker processes.  They are forked from this process, so
+        should be started before any threads that may hold a lock at the time
+        '''
+        if (None != self._pool):
+            return
+
+        self._pool = multiprocessing.Pool(self._processes, _start_worker)
+
+    def stop(self):
+        '''
+        Stops the worker processes
+        '''
+        if (None == self._pool):
+            return
+
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+        self._busy = 0
+
+    # PRIVATE METHODS
+
+    def _done(self, data):
+        '''
+        Frees up a worker once its round is dealt, whether or not it is still
+        waited on
+        '''
+        with self._lock:
+            self._busy -= 1
@@ -0,0 +1,188 @@
+'''
+Equity of hands against each other: each hand's share of the pot over the
+boards that can still come, hands that tie splitting their share.
+
+When few enough boards can come they are all evaluated, otherwise boards
+are sampled at random (seeded for repeatable results) until the error bound
+on every equity is within the precision asked for, the sample limit is hit
+or time runs out.
+'''
+
+import itertools
+import math
+import random
+import re
+import sys
+import time
+
+import cards
+
+''' Max number of boards that are all evaluated instead of sampled '''
+EXHAUSTIVE_MAX = 5000
+
+''' Max number of boards sampled '''
+SAMPLE_MAX = 100000
+
+''' Number of boards sampled between checks of the error bound '''
+SAMPLE_BATCH = 250
+
+''' Standard scores for the error bound, 1.96 for 95% confidence '''
+CONFIDENCE_Z = 1.96
+
+def calc_equity(hands, board = (), dead = (), precision = .01, seed = None
+              , samples = SAMPLE_MAX, time_limit = None, exhaustive_max = EXHAUSTIVE_MAX):
+    '''
+    Finds the equity of each hand
+    @param hands list of hands
+    @param board list of board cards so far (0 to 5 of them)
+    @param dead list of cards out of play that are in neither the hands nor the board
+    @param precision error bound sampling stops at
+    @param seed seed for sampling, None for a random seed
+    @param samples max number of boards sampled
+    @param time_limit max number of seconds spent sampling, None for no limit
+    @param exhaustive_max max number of boards that are all evaluated instead of sampled
+    @return list of equities (0-1) in hand order, error bound on them (0 if every
+            board was evaluated) and the number of boards evaluated
+    '''
+    board = list(board)
+    needed = 5 - len(board)
+
+    deck = cards.Deck()
+    deck.remove([card for hand in hands for card in hand.hole] + board + list(dead))
+    remaining = list(deck.remaining_cards())
+
+    totals = [0.0] * len(hands)
+    squares = [0.0] * len(hands)
+
+    # nothing left to come
+    if (0 == needed):
+        _share([cards.evaluate(hand.hole + board) for hand in hands], totals, squares)
+        return totals, 0.0, 1
+
+    partials = [cards.evaluate_partial(hand.hole + board) for hand in hands]
+
+    # every board
+    if (_count_boards(len(remaining), needed) <= exhaustive_max):
+
+        count = 0
+        memo = [None, None]
+        for runout in itertools.combinations(remaining, needed):
+            _share(_strengths(partials, runout, memo), totals, squares)
+            count += 1
+
+        return [total / count for total in totals], 0.0, count
+
+    # sampled boards
+    rng = random.Random(seed)
+    started = time.time()
+
+    count = 0
+    error = 1.0
+    while (count < samples):
+
+        memo = [None, None]
+        for i in range(0, min(SAMPLE_BATCH, samples - count)):
+            _share(_strengths(partials, rng.sample(remaining, needed), memo), totals, squares)
+            count += 1
+
+        error = _error(totals, squares, count)
+        if (error <= precision or (None != time_limit and time.time() - started >= time_limit)):
+            break
+
+    return [total / count for total in totals], error, count
+
+# PRIVATE FUNCTIONS
+
+def _count_boards(cards_left, needed):
+    '''
+    @param cards_left number of cards left to deal the board from
+    @param needed number of board cards still to come
+    @return number of boards that can come
+    '''
+    count = 1
+    for i in range(0, needed):
+        count = count * (cards_left - i) // (i + 1)
+
+    return count
+
+def _strengths(partials, runout, memo):
+    '''
+    Finds the strength of every hand with a runout added to the board.  All
+    but the last card of the runout are added to the evaluator states once
+    and remembered, as enumerated runouts come in order
+    @param partials evaluator states of the hands with the board
+    @param runout cards completing the board
+    @param memo [runout without its last card, evaluator states with it] of the last call
+    @return list of packed strengths in hand order
+    '''
+    prefix = tuple(runout[:-1])
+    if (prefix != memo[0]):
+
+        extended = partials
+        for card in prefix:
+            extended = [cards.evaluate_add(partial, card) for partial in extended]
+
+        memo[0] = prefix
+        memo[1] = extended
+
+    last = runout[-1]
+    return [cards.evaluate_next(partial, last) for partial in memo[1]]
+
+def _share(strengths, totals, squares):
+    '''
+    Splits the pot of a board between the best hands, adding each hand's
+    share to the running totals
+    @param strengths packed strength of every hand
+    @param totals running total of each hand's share
+    @param squares running total of the square of each hand's share
+    '''
+    best = max(strengths)
+    winners = strengths.count(best)
+    share = 1.0 / winners
+
+    for i in range(0, len(strengths)):
+        if (best == strengths[i]):
+            totals[i] += share
+            squares[i] += share * share
+
+def _error(totals, squares, count):
+    '''
+    @return error bound on the equity of the hand with the most variance
+    '''
+    error = 0.0
+    for total, square in zip(totals, squares):
+        mean = total / count
+        variance = max(square / count - mean * mean, 0.0)
+        error = max(error, CONFIDENCE_Z * math.sqrt(variance / count))
+
+    return error
+
+
+if __name__ == "__main__":
+
+    '''
+    Equity of hands from the command line:  python equity.py AhAs KdKc [-b Qh10d2c] [-s seed]
+    '''
+
+    by_string = dict((card.to_string(), card) for card in cards.CARDS)
+    parse = lambda text: [by_string[card] for card in re.findall('(?:10|.)[hsdc]', text)]
+
+    hands = []
+    board = []
+    seed = None
+    args = sys.argv[1:]
+    while (args):
+        arg = args.pop(0)
+        if ('-b' == arg):
+            board = parse(args.pop(0))
+        elif ('-s' == arg):
+            seed = int(args.pop(0))
+        else:
+            hands.append(cards.Hand(*parse(arg)))
+
+    started = time.time()
+    equities, error, count = calc_equity(hands, board, seed = seed)
+
+    for hand, equity in zip(hands, equities):
+        print hand.to_string() + ' ' + ('%.4f' % equity)
+    print ('+/- %.4f over %d boards in %.3fs' % (error, count, time.time() - started))
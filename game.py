@@ -1,8 +1,68 @@
+import itertools
 from time import time
 import random
 
+import batch
+import cache
 import cards
 
+''' Max number of canonical deals to remember the outs of, 0 turns it off.
+Random deals rarely repeat, so it is only worth turning on when the same deals
+come up again and again '''
+OUTS_CACHE_SIZE = 0
+
+''' Outs of previously calculated deals keyed by canonical deal, None when off '''
+OUTS_CACHE = cache.LRUCache(OUTS_CACHE_SIZE) if 0 < OUTS_CACHE_SIZE else None
+
+''' Optional pool of pre-dealt rounds (see pool.RoundPool) new rounds are drawn from '''
+ROUND_POOL = None
+
+''' Optional dealer (see dealer.ProcessDealer) dealing the rounds the pool cannot supply '''
+ROUND_DEALER = None
+
+'''
+Finds a key for a deal that is the same for every deal that only differs by
+relabeled suits, the order of hole cards, the order of opponents or the
+order of the board, all of which have the same outs
+@param hands list of hands, with the player's hand first
+@param board list of board cards
+@return canonical key and the suit permutation mapping the deal onto it
+'''
+def canonical_deal(hands, board):
+
+    # each suit's signature is where its ranks are dealt, which relabeling
+    # suits or reordering cards and opponents does not change
+    signatures = []
+    for suit in range(0, cards.Deck.SUIT_COUNT):
+        ranks = [tuple(sorted([card.rank for card in hand.hole if suit == card.suit])) for hand in hands]
+        signatures.append((ranks[0], tuple(sorted(ranks[1:]))
+                         , tuple(sorted([card.rank for card in board if suit == card.suit]))))
+
+    # suits are labeled in signature order, only suits with the same signature
+    # need each of their orders tried
+    order = sorted(range(0, cards.Deck.SUIT_COUNT), key = lambda suit: signatures[suit])
+    groups = [list(group) for signature, group in itertools.groupby(order, lambda suit: signatures[suit])]
+    orders = itertools.product(*[itertools.permutations(group) if 1 < len(group) else [group] for group in groups])
+
+    best = None
+    best_perm = None
+    for grouped in orders:
+
+        perm = [0] * cards.Deck.SUIT_COUNT
+        for label, suit in enumerate([suit for group in grouped for suit in group]):
+            perm[suit] = label
+
+        player = tuple(sorted([card.rank << 2 | perm[card.suit] for card in hands[0].hole]))
+        opponents = tuple(sorted([tuple(sorted([card.rank << 2 | perm[card.suit] for card in hand.hole]))
+                                  for hand in hands[1:]]))
+        key = (player, opponents, tuple(sorted([card.rank << 2 | perm[card.suit] for card in board])))
+
+        if (None == best or key < best):
+            best = key
+            best_perm = perm
+
+    return best, best_perm
+
 class Game:
     '''
     A whole game of how many outs
@@ -26,10 +86,20 @@ class Game:
     ''' Starting amount of time you get in seconds in a round '''
     ROUND_TIME_START = 75
 
+    ''' Outs that come up often against one opponent and get dealt again once '''
+    REDEAL_OUTS_COMMON = [3, 6]
+
+    ''' Max number of times a round is dealt looking for a common number of outs '''
+    REDEAL_COMMON_MAX = 2
+
+    ''' Max number of times a round is dealt looking for more than 0 outs '''
+    REDEAL_NONE_MAX = 3
+
     def __init__(self, id = 0):
 
         self._round_count = Game.ROUND_COUNT
         self._rounds = []
+        self._played = 0
 
         self._score = 0
         self._multiplier = 1
@@ -78,7 +148,7 @@ class Game:
             time_passed = max(min(time_allowed, time_passed), 0)
 
             time_percent = 1
-            if (1 < len(self._rounds)):
+            if (1 < self._played):
                 time_percent = (time_allowed - time_passed) / time_allowed
             
             if (time_percent < 0):
@@ -109,49 +179,126 @@ class Game:
                 self._rounds.append(None)
 
                 
-    def new_round(self):
+    def new_round(self, a_round = None):
         '''
         Create a new hand/round in the game
+        @param a_round round dealt ahead of time, only used if it has the right number of opponents
         @return newly created round
         '''
 
+        if (0 < self.rounds_remaining()):
+
+            # deal the player and number of opponents based on the multiplier
+            opponents = self.get_opponents()
+
+            if (None == a_round or opponents != len(a_round.get_hands()) - 1):
+                a_round = Game.supply_round(opponents)
+
+            a_round.start(self._played + 1)
+
+            # only the current round is kept, earlier rounds are only ever
+            # looked at once saved
+            self._rounds = [a_round]
+            self._played += 1
+
+        else:
+            a_round = None
+            
+        return a_round
+
+    @staticmethod
+    def supply_round(opponents):
+        '''
+        Gets a round to be started as the next round of a game, the quickest
+        way there is
+        @param opponents number of opponents in the round
+        @return dealt round
+        '''
+
+        # a pre-dealt round from the pool is already distributed like a
+        # dealt one, then a dealer elsewhere, then deal it here
         a_round = None
+        if (None != ROUND_POOL):
+            a_round = ROUND_POOL.draw(opponents)
 
-        if (0 < self.rounds_remaining()):
+        if (None == a_round and None != ROUND_DEALER):
+            a_round = ROUND_DEALER.deal(opponents)
 
-            # certain out scenarios (0,3,6) come up way more frequently when randomly 
-            # generating a hand.  to achieve a slightly more  distributed number of outs for each round, 
-            # if we hit when of the common cases, generate again
-            iterations = 0
-            again = True
+        if (None == a_round):
+            a_round = Game.deal_round(opponents)
 
-            while (again):
+        return a_round
 
-                a_round = Round(len(self._rounds) + 1)
+    @staticmethod
+    def deal_round(opponents):
+        '''
+        Deals a round to be started as the next round of a game
+        @param opponents number of opponents to deal
+        @return dealt round
+        '''
 
-                # deal the player and number of opponents based on the multiplier
-                opponents = 1
-                if (6 <= self._multiplier):
-                    opponents = 3
-                elif (3 <= self._multiplier):
-                    opponents = 2
+        # certain out scenarios (0,3,6) come up way more frequently when randomly 
+        # generating a hand.  to achieve a slightly more  distributed number of outs for each round, 
+        # if we hit when of the common cases, generate again
+        iterations = 0
+        again = True
 
-                a_round.deal(opponents)
+        while (again):
 
-                # determine if we should try again 
-                again = False
-                iterations +=1                 
-                if ((1 == opponents and len(a_round.outs) in [3, 6]  and iterations < 2)\
-                 or (0 == len(a_round.outs) and iterations < 3)):
-                    again = True
+            a_round = Round(0)
+            a_round.deal(opponents)
+
+            # determine if we should try again 
+            iterations +=1                 
+            again = Game.should_redeal(opponents, len(a_round.outs), iterations)
 
-            self._rounds.append(a_round)
-            
         return a_round
 
+    @staticmethod
+    def should_redeal(opponents, outs, iterations):
+        '''
+        @param opponents number of opponents in the dealt round
+        @param outs number of outs in the dealt round
+        @param iterations number of times the round has been dealt so far
+        @return True if the round should be dealt again
+        '''
+        return (1 == opponents and outs in Game.REDEAL_OUTS_COMMON and iterations < Game.REDEAL_COMMON_MAX) \
+            or (0 == outs and iterations < Game.REDEAL_NONE_MAX)
+
+    def get_opponents(self):
+        ''' Number of opponents to deal in the next round based on the multiplier '''
+        opponents = 1
+        if (6 <= self._multiplier):
+            opponents = 3
+        elif (3 <= self._multiplier):
+            opponents = 2
+
+        return opponents
+
+    def restore(self, rounds, score, multiplier, played = None):
+        '''
+        Restores a game in progress from saved state
+        @param rounds list of the latest rounds played, ending in None if the game is over
+        @param score score so far
+        @param multiplier current multiplier
+        @param played number of rounds played so far, defaults to the number of rounds given
+        '''
+        self._rounds = rounds
+        self._score = score
+        self._multiplier = multiplier
+        self._played = played if None != played else len([a_round for a_round in rounds if None != a_round])
+
     def rounds_remaining(self):
         ''' Number of rounds remaining in the game '''
-        return self._round_count - len(self._rounds)
+        return self._round_count - self._played
+
+    def rounds_completed(self):
+        ''' Number of rounds guessed so far '''
+        a_round = self.get_cur_round()
+        if (None != a_round and not a_round.complete):
+            return self._played - 1
+
+        return self._played
 
 
     def get_points_possible(self):
@@ -161,7 +308,7 @@ class Game:
     def get_time_allowed(self):
         ''' Max amount of time in current round '''
         time_allowed = -1
-        if (1 < len(self._rounds)):
+        if (1 < self._played):
             time_allowed = Game.ROUND_TIME_START
 
         return time_allowed 
@@ -180,6 +327,14 @@ class Game:
     def multiplier(self):
         return self._multiplier
 
+    @property
+    def played(self):
+        return self._played
+
+    @property
+    def rounds(self):
+        return self._rounds
+
 class Round:
     '''
     A round is a single hand with 1 player hand and X opponents hands. 
@@ -189,7 +344,8 @@ class Round:
 
         self._id = id
 
-        self._deck = cards.Deck()
+        # the deck is only around while dealing
+        self._deck = None
         self._board = None
 
         self._time_started = time()
@@ -202,6 +358,7 @@ class Round:
         self._dealt = False
 
         self._outs = None
+        self._runner_outs = None
         self._draws = None
         self._ahead = None
 
@@ -210,13 +367,15 @@ class Round:
 
         self._points = None
 
-    def deal(self, opponents):
+    def deal(self, opponents, board = 4):
         '''
         Deals hole cards to the player and to X opponents and 4 cards
         to the board.  Figures out if the player is ahead or behin:
         1) if the player is ahead, finds the outs the player has to lose
         2) if the player is behind, finds the outs the player has to win
+        On the flop the outs are turn cards, along with runner-runner outs
         @param opponents number of opponent hands to deal
+        @param board number of board cards, 4 for the turn or 3 for the flop
         '''
 
         # we can't deal twice
@@ -225,6 +384,7 @@ class Round:
 
         # shuffle it up!
         self._dealt = True
+        self._deck = cards.Deck()
         self._deck.shuffle()
 
         # deal out the player hand
@@ -236,17 +396,64 @@ class Round:
             hand = cards.Hand(self._deck.deal(), self._deck.deal())
             self._hand_opponents.append(hand)
 
-        # now the four cards on the board
+        # now the cards on the board
         self._board = []
-        for i in range(0, 4):
+        for i in range(0, board):
             self._board.append(self._deck.deal())
 
         # figure out if the player is ahead or not after the turn
         self._ahead = self._calc_ahead()
 
         # calculate the number of outs the player or opponents have
-        self._calc_outs()
+        if (3 == board):
+            self._calc_flop_outs()
+        else:
+            self._calc_outs()
+
+        # the deck is not needed once the outs are known
+        self._deck = None
 
+    def restore(self, hands, board, ahead, outs, draws, time_started, time_ended = None, guess = None, points = None, runner_outs = None):
+        '''
+        Restores a dealt round, and if there was a guess an ended round, from
+        saved state
+        @param hands all the hands in the round, with the player's hand first
+        @param board board of the round
+        @param ahead <0 if the player is behind, 0 on tie, 1 if ahead
+        @param outs list of out cards
+        @param draws number of cards that could have come on the river
+        @param time_started time the round started
+        @param time_ended time the round ended, None if not ended
+        @param guess player's guess, None if not ended
+        @param points points the player got in the round, None if not ended
+        @param runner_outs list of runner-runner outs of a flop round, None on the turn
+        '''
+        self._dealt = True
+        self._hand_player = hands[0]
+        self._hand_opponents = hands[1:]
+        self._board = board
+        self._ahead = ahead
+        self._outs = outs
+        self._runner_outs = runner_outs
+        self._draws = draws
+        self._time_started = time_started
+
+        if (None != guess):
+            self._complete = True
+            self._guess = guess
+            self._guess_distance = guess - len(outs)
+            self._time_ended = time_ended
+            self._points = points
+
+
+    def start(self, id):
+        '''
+        Starts an already dealt round (i.e. from a pool) as round <id> of a
+        game, with the clock starting now
+        @param id round number in the game
+        '''
+        self._id = id
+        self._time_started = time()
 
     def end(self, guess):
         '''
@@ -289,9 +496,18 @@ class Round:
     def outs(self):
         return self._outs
 
+    @property
+    def runner_outs(self):
+        ''' (turn, river) card pairs that are outs together on the flop, None on the turn '''
+        return self._runner_outs
+
     @property
     def ahead(self):
         return self._ahead
+
+    @property
+    def complete(self):
+        return self._complete
     
     @property
     def draws(self):
@@ -333,18 +549,16 @@ class Round:
         the opponents
         @return <0 if behind, 0 on tie, 1 if ahead
         '''
-        comp = False
         self._hand_player.make(self._board)
         for hand in self._hand_opponents:
-
             hand.make(self._board)
 
-            # as soon as the player's hand loses against an opponent we be out
-            temp = self._hand_player.compare(hand)
-            hand.reset()
+        # the player is only as far ahead as the best opponent allows
+        best = max(self._hand_opponents, key=lambda hand: hand.strength)
+        comp = self._hand_player.compare(best)
 
-            if (False == comp or temp < comp):
-                comp = temp
+        for hand in self._hand_opponents:
+            hand.reset()
 
         if (1 < comp):
             comp = 1
@@ -363,26 +577,123 @@ class Round:
         self._outs = []
         self._draws = self._deck.remaining()
 
+        # an equivalent deal may have been seen already, the cached outs just
+        # need their suits mapped back to the cards left in this deck
+        key = None
+        outs = None
+        if (None != OUTS_CACHE):
+            key, perm = canonical_deal(self.get_hands(), self._board)
+            outs = OUTS_CACHE.get(key)
+
+        if (None != outs):
+
+            remaining = {}
+            for card in self._deck.remaining_cards():
+                remaining[card.rank << 2 | perm[card.suit]] = card
+
+            for code in outs:
+                self._outs.append(remaining[code])
+
+            self._outs.sort(cards.compare_card_all)
+            return
+
+        # with numpy every river card is evaluated in one go, otherwise one by one
+        if (batch.AVAILABLE):
+
+            river = list(self._deck.remaining_cards())
+            self._outs = batch.calc_outs(self._hand_player, self._hand_opponents, self._board, river, self._ahead)
+
+        else:
+            self._calc_outs_scalar()
+
+        self._outs.sort(cards.compare_card_all)
+        if (None != key):
+            OUTS_CACHE.set(key, tuple([card.rank << 2 | perm[card.suit] for card in self._outs]))
+
+    def _calc_flop_outs(self):
+        '''
+        calc the turn cards that are outs for the player to win/lose the hand
+        on the flop, and the runner-runner outs: turn and river pairs that are
+        outs together where neither card is an out on the turn
+        '''
+
+        hands = self.get_hands()
+        remaining = list(self._deck.remaining_cards())
+        self._draws = len(remaining)
+
+        # each hand with the flop, then with each turn card
+        partials = [cards.evaluate_partial(hand.hole + self._board) for hand in hands]
+        turns = []
+
+        self._outs = []
+        for card in remaining:
+            turns.append([cards.evaluate_add(partial, card) for partial in partials])
+            if (self._changes_lead([cards.evaluate_next(partial, card) for partial in partials])):
+                self._outs.append(card)
+
+        self._outs.sort(cards.compare_card_all)
+
+        # pairs with a turn out in them are not runner-runner, so are never evaluated
+        outs = cards.to_mask(self._outs)
+        kept = [i for i, card in enumerate(remaining) if not outs & (1 << card.index)]
+
+        self._runner_outs = []
+
+        # with numpy every pair is evaluated in one go, otherwise each hand's
+        # strength by river rank is looked up once for each turn card
+        if (batch.AVAILABLE):
+            self._runner_outs = batch.calc_runner_outs([turns[i] for i in kept], [remaining[i] for i in kept], self._ahead)
+            return
+
+        for at, i in enumerate(kept):
+
+            turn = remaining[i]
+            ranks = [cards.evaluate_partial_ranks(partial) for partial in turns[i]]
+            for j in kept[at + 1:]:
+
+                card = remaining[j]
+                strengths = [max(by_rank[card.rank], partial[3]
+                               , cards.FLUSH_STRENGTHS[partial[1][card.suit] | cards.RANK_BITS[card.rank]])
+                             for by_rank, partial in zip(ranks, turns[i])]
+                if (self._changes_lead(strengths)):
+                    self._runner_outs.append((turn, card))
+
+    def _changes_lead(self, strengths):
+        '''
+        @param strengths strength of every hand, with the player's hand first
+        @return True if the player was ahead (or tied) and is now behind, or the other way around
+        '''
+        ahead = strengths[0] - max(strengths[1:])
+        return (0 <= self._ahead and 0 > ahead) or (0 > self._ahead and 0 <= ahead)
+
+    def _calc_outs_scalar(self):
+        '''
+        calc the outs the player has to win/lose the hand one river card at a time
+        '''
+
+        # evaluate every hand with the turn board once, each river card is
+        # then only added on top of that
+        hands = self.get_hands()
+        for hand in hands:
+            hand.prepare(self._board)
+
         # go through each remaining card in the deck:
-        # 1) add the card to the board
-        # 2) make all hands with the full board
-        # 3) compare all hands, add an out appropriately
-        # 4) remove the card from the board
-        while(None != self._deck.deal()):
+        # 1) find the strength of all hands with the card as the river
+        # 2) compare the player against the best opponent, add an out appropriately
+        for card in self._deck.remaining_cards():
 
             # 1
-            self._board.append(self._deck.last)
+            player = self._hand_player.strength_with(card)
+            best = max([hand.strength_with(card) for hand in self._hand_opponents])
 
-            # 2, # 3
-            ahead = self._calc_ahead()
-            if ((0 <= self._ahead and 0 > ahead) 
+            # 2
+            ahead = player - best
+            if ((0 <= self._ahead and 0 > ahead)
              or (0 > self._ahead and  0 <= ahead)):
-                self._outs.append(self._deck.last)
-
-            # 4
-            self._board.pop()
+                self._outs.append(card)
 
-        self._outs.sort(cards.compare_card_all)
+        for hand in hands:
+            hand.reset()
 
 
 
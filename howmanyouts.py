@@ -1,11 +1,12 @@
+import atexit
 from contextlib import closing
 import inspect
 import os
-import pickle
+import Queue
 import random
 import sqlite3
+import sys
 from time import time
-import zlib
 
 from flask import Flask
 from flask import g
@@ -16,7 +17,17 @@ from flask import render_template
 from flask import session
 from flask import url_for
 
+import batch
+import cache
+import cards
+import codec
+import dealer
 import game
+import metrics
+import pool
+import ranks
+import speculate
+import writer
 
 '''
 *************
@@ -33,9 +44,86 @@ LEADERBOARD_START = 1327168800
 # Interval in seconds between leaderboard resets
 LEADERBOARD_INTERVAL = 604800
 
+# Number of scores on a leaderboard
+LEADERBOARD_SIZE = 5
+
 # Directory of this top level module
 DIR_TOP = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 
+# Number of pre-dealt rounds kept for each number of opponents, 0 turns off the pool
+ROUND_POOL_SIZE = 200
+
+# Number of pre-dealt rounds left before the pool is refilled
+ROUND_POOL_LOW = 50
+
+# Number of processes dealing rounds the pool cannot supply, 0 deals them in
+# the request and None uses one for each core
+ROUND_DEALER_PROCESSES = 0
+
+# Max number of seconds a request waits on a dealing process before dealing
+# the round itself, which it also does straight away when every process is
+# busy.  A round trip to a process costs more than dealing a turn round
+# inline, so the processes only pay off for rounds slower to deal, like the
+# flop with its runner-runner outs
+ROUND_DEALER_TIMEOUT = .05
+
+# Max number of games each worker deals the next round of while the player
+# is still guessing, 0 deals the next round when it is asked for
+SPECULATE_SIZE = 1000
+
+# Max number of games in play kept in memory by each worker, 0 turns off the cache
+GAME_CACHE_SIZE = 1000
+
+# Seconds a game in play stays in memory without being played
+GAME_CACHE_TTL = 600
+
+# Optional shelve file the cached games are also kept in, so games in play
+# survive a restart, None keeps them only in memory.  A shelve file cannot be
+# shared, so only for running a single worker
+GAME_CACHE_FILE = None
+
+# Games in play keyed by game id, along with the version of the game saved
+GAME_CACHE = cache.LRUCache(GAME_CACHE_SIZE, GAME_CACHE_TTL, GAME_CACHE_FILE)
+if (None != GAME_CACHE_FILE):
+    atexit.register(GAME_CACHE.close)
+
+# Seconds the leaders shown with each game are cached for, which bounds how
+# long other workers show an old leader
+HISCORE_CACHE_TTL = 60
+
+# Leader name and score keyed by period, cleared whenever this worker changes a leader
+HISCORE_CACHE = cache.LRUCache(8, HISCORE_CACHE_TTL)
+
+# Max number of seconds a game in play waits to be saved to the database in
+# the background, 0 saves it during the request.  Saving in the background is
+# only safe when a player's requests always reach the same worker, as other
+# workers read what is in the database
+WRITE_BEHIND_WAIT = 0
+
+# Function running blocking work (dealing rounds and database calls) off the
+# request, called with a function and a tuple of arguments.  None runs the work
+# in the request, serve.py hands it to a thread pool
+OFFLOAD = None
+
+# Max number of idle database connections kept open by each worker
+DB_POOL_SIZE = 8
+
+# Number of prepared statements each database connection keeps around, more
+# than the 100 sqlite3 keeps by default so every query the game makes stays
+# prepared
+DB_CACHED_STATEMENTS = 128
+
+# Pragmas run on every new database connection
+DB_PRAGMAS = ['PRAGMA journal_mode = WAL'
+            , 'PRAGMA synchronous = NORMAL'
+            , 'PRAGMA cache_size = -8000'
+            , 'PRAGMA mmap_size = 67108864']
+
+# Times the hot paths and counts deals and hand evaluations, for each request
+# in a Server-Timing header and in total at /metrics.  Off leaves every
+# function as it is, so costs nothing
+METRICS = False
+
 
 '''
 *************
@@ -72,11 +160,12 @@ def game_new():
    
         # create the new game and first round
         a_game = game.Game(game_id)
-        a_round = a_game.new_round()
+        a_round = offload(a_game.new_round)
 
         # save the game to the database and session
         session["game_id"] = game_id
-        write_db("UPDATE game SET data = ? WHERE ROWID = ?", [buffer(zlib.compress(pickle.dumps(a_game))), game_id])
+        save_game(a_game)
+        speculate_round(a_game)
 
         # return info about the current game and round
         ret = get_game_info(a_game)
@@ -92,11 +181,14 @@ def game_guess(guess = None):
 
     ret = {'status' : 'error'}
 
+    # the highest guess button stands for that many outs or more, nothing
+    # past it can be a guess (or fit in a saved round)
+    if (None == guess or game.Game.GUESS_VALUE_GREATER < guess):
+        return jsonify(game=ret)
+
     # retrieve game from session and database
     game_id = session["game_id"]    
-    results = query_db("SELECT data FROM game WHERE ROWID = ?", [game_id], True)
-
-    a_game = pickle.loads(zlib.decompress(results['data']).encode('utf-8'))
+    a_game = load_game(game_id)
     
     # process a guess if there was a game and a guess
     if (None != guess and None != a_game and None != a_game.get_cur_round()):
@@ -104,9 +196,27 @@ def game_guess(guess = None):
         #  end round
         a_round = a_game.get_cur_round()        
         a_game.end_round(guess)        
+        over = None == a_game.get_cur_round()
 
-        # save to db
-        write_db("UPDATE game SET data = ?, score = ?, completed = ? WHERE ROWID = ?", [buffer(zlib.compress(pickle.dumps(a_game))), a_game.score, a_round.id, game_id])
+        # save to db, the end of the game right away and in one transaction
+        # with everything else written for it, marking the game completed as
+        # it will not be played again
+        if (over):
+            begin_writes()
+
+            ended = [] if None == GAME_WRITER else GAME_WRITER.discard(game_id)
+            ended.append(encode_round(a_round))
+            for id, data in ended:
+                write_db(writer.WriteBehind.QUERY_ROUND, [game_id, id, data])
+
+            write_db("UPDATE game SET data = ?, score = ?, completed = ?, time_completed = ?, version = version + 1 WHERE ROWID = ?"
+                   , [buffer(codec.encode_game(a_game)), a_game.score, a_round.id, time(), game_id])
+
+        else:
+            save_game(a_game, a_round)
+
+        # the guess settles how many opponents the next round has
+        speculate_round(a_game)
 
         # new return givin the player feedback to what happened last round
         ret = get_game_info(a_game)
@@ -121,15 +231,17 @@ def game_guess(guess = None):
         for card in a_round.outs:
             ret["feedback"]["outs"].append(card.to_string())
 
-        # if the game is over, mark the game as completed and find out where this player's score ranks!
-        if (None == a_game.get_cur_round()):
+        # if the game is over, find out where this player's score ranks!
+        if (over):
 
-            # mark completed
-            write_db("UPDATE game SET time_completed = ? WHERE ROWID = ?", [time(), game_id])
+            # put the game on the all time and current interval leaderboards
+            leaders = []
+            last = get_interval_start()
+            update_leaderboard(game_id, session["name"], a_game.score, 0)
+            update_leaderboard(game_id, session["name"], a_game.score, last)
 
             # grab rank all time
-            results = query_db("SELECT COUNT(*) as rank FROM game WHERE completed = ? AND time_completed IS NOT NULL AND score > ?", [game.Game.ROUND_COUNT, a_game.score], True)            
-            rank = int(results['rank']) + 1
+            rank = offload(ranks.count_above, g.db, 0, a_game.score) + 1
 
             ret["feedback"]["rank"] = rank
 
@@ -137,22 +249,31 @@ def game_guess(guess = None):
             if (1 == rank):
                 write_db("DELETE FROM hiscores WHERE period = 0", commit = False)
                 write_db("INSERT INTO hiscores (game_id, period) VALUES (?, ?)", [game_id, 0])                
+                leaders.append(0)
 
             # grab rank last interval
-            now = time()
-            last = int(now - ((now - LEADERBOARD_START) % LEADERBOARD_INTERVAL))
-            
-            results = query_db("SELECT COUNT(*) as rank FROM game WHERE completed = ? AND time_completed IS NOT NULL AND time_completed >= ? AND score > ?", [game.Game.ROUND_COUNT, last,  a_game.score], True)            
-            rank = int(results['rank']) + 1
+            rank = offload(ranks.count_above, g.db, last, a_game.score) + 1
 
             # update last interval
             if (1 == rank):
                 write_db("DELETE FROM hiscores WHERE period = ?", [last], commit=False)
                 write_db("INSERT INTO hiscores (game_id, period) VALUES (?, ?)", [game_id, last])                
+                leaders.append(last)
 
 
             ret["feedback"]["rank_interval"] = rank
 
+            # count the score in the rank index once it has been ranked
+            offload(ranks.add_score, g.db, 0, a_game.score)
+            offload(ranks.add_score, g.db, last, a_game.score)
+
+            commit_writes()
+
+            # only once committed, so nothing caches what could still be rolled back
+            GAME_CACHE.remove(game_id)
+            for period in leaders:
+                HISCORE_CACHE.remove(period)
+
  
     return jsonify(game=ret)
 
@@ -164,18 +285,21 @@ def game_round():
 
     # retrieve game from session and database
     game_id = session["game_id"]    
-    results = query_db("SELECT data FROM game WHERE ROWID = ?", [game_id], True)
-
-    a_game = pickle.loads(zlib.decompress(results['data']).encode('utf-8'))    
+    a_game = load_game(game_id)
 
     # create a new round  if there is a game and a new round
     if (None != a_game and None != a_game.get_cur_round()):
 
-        # start new round
-        a_game.new_round()
+        # start new round, dealt while the player was guessing if it is ready
+        a_round = None
+        if (None != SPECULATOR):
+            a_round = SPECULATOR.take(game_id, a_game.get_opponents())
+
+        offload(a_game.new_round, a_round)
 
         # save to db
-        write_db("UPDATE game SET data = ? WHERE ROWID = ?", [buffer(zlib.compress(pickle.dumps(a_game))), game_id])
+        save_game(a_game)
+        speculate_round(a_game)
 
         # new return
         ret = get_game_info(a_game)
@@ -201,7 +325,11 @@ def game_name(name):
 
 
     if (None != session["game_id"]):
-        write_db("UPDATE game SET name = ? WHERE ROWID = ?", [session["name"], session["game_id"]])        
+        write_db("UPDATE game SET name = ? WHERE ROWID = ?", [session["name"], session["game_id"]], commit = False)        
+        write_db("UPDATE leaderboard SET name = ? WHERE game_id = ?", [session["name"], session["game_id"]])
+
+        # the game may be a leader
+        HISCORE_CACHE.clear()
 
 
     return resp
@@ -215,15 +343,12 @@ def scores(interval):
     ret = {'status' : 'error'}
 
     # either grab all time or the last interval
-    start = 0
-    now = time()
-    last = int(now - ((now - LEADERBOARD_START) % LEADERBOARD_INTERVAL))
-
+    period = 0
     if ("interval" == interval):
-        start = last
+        period = get_interval_start()
 
-    # query the db for last 10 scores    
-    results = query_db("SELECT name, score FROM game WHERE completed = ? AND time_completed IS NOT NULL AND time_completed >= ? ORDER BY score DESC LIMIT 5", [game.Game.ROUND_COUNT, start])
+    # query the leaderboard for the top scores
+    results = query_db("SELECT name, score FROM leaderboard WHERE period = ? ORDER BY score DESC, game_id LIMIT ?", [period, LEADERBOARD_SIZE])
 
     if (None != results):        
         
@@ -241,6 +366,20 @@ def scores(interval):
 
     return jsonify(game=ret)
 
+@app.route('/metrics', methods = ['GET'])
+def metrics_totals():
+    '''
+    Grab the timings and counts of this worker since it started
+    '''
+
+    ret = {'status' : 'error'}
+
+    if METRICS:
+        ret = metrics.snapshot()
+        ret["status"] = "ok"
+
+    return jsonify(metrics=ret)
+
 
 
 @app.errorhandler(500)
@@ -270,21 +409,172 @@ def get_game_info(a_game):
     ret["interval_name"] = "Nobody Yet!"
     ret["interval_score"] = "0"
 
-    results = query_db("SELECT g.score, g.name FROM game AS g, hiscores AS h WHERE g.ROWID = h.game_id AND h.period = 0", [], True)
-    if (None != results):
-        ret["alltime_name"] = results["name"]
-        ret["alltime_score"] = results["score"]
+    leader = get_leader(0)
+    if (leader):
+        ret["alltime_name"], ret["alltime_score"] = leader
 
-    now = time()
-    last_period = int(now - ((now - LEADERBOARD_START) % LEADERBOARD_INTERVAL))    
-    results = query_db("SELECT g.score, g.name FROM game AS g, hiscores AS h WHERE g.ROWID = h.game_id AND h.period = ?", [last_period], True)
-    if (None != results):
-        ret["interval_name"] = results["name"]
-        ret["interval_score"] = results["score"]    
+    leader = get_leader(get_interval_start())
+    if (leader):
+        ret["interval_name"], ret["interval_score"] = leader
 
     return ret
 
 
+def get_leader(period):
+    '''
+    Helper for finding the leader of a period, cached as leaders rarely change
+    @param period 0 for all time, otherwise the start of the interval
+    @return name and score of the leader, or an empty tuple if there is not one
+    '''
+
+    leader = HISCORE_CACHE.get(period)
+    if (None == leader):
+
+        leader = ()
+        results = query_db("SELECT g.score, g.name FROM game AS g, hiscores AS h WHERE g.ROWID = h.game_id AND h.period = ?", [period], True)
+        if (None != results):
+            leader = (results["name"], results["score"])
+
+        HISCORE_CACHE.set(period, leader)
+
+    return leader
+
+
+def get_interval_start(now = None):
+    '''
+    Helper for finding when the current leaderboard interval started
+    @param now time to find the interval of, defaults to now
+    '''
+
+    if (None == now):
+        now = time()
+
+    return int(now - ((now - LEADERBOARD_START) % LEADERBOARD_INTERVAL))
+
+
+def update_leaderboard(game_id, name, score, period):
+    '''
+    Helper for putting a completed game on a leaderboard, keeping only the
+    top scores
+    @param period 0 for all time, otherwise the start of the interval
+    '''
+
+    write_db("INSERT OR REPLACE INTO leaderboard (period, game_id, name, score) VALUES (?, ?, ?, ?)", [period, game_id, name, score], commit = False)
+    write_db("DELETE FROM leaderboard WHERE period = ? AND game_id NOT IN "
+             "(SELECT game_id FROM leaderboard WHERE period = ? ORDER BY score DESC, game_id LIMIT ?)", [period, period, LEADERBOARD_SIZE])
+
+
+def load_game(game_id):
+    '''
+    Helper for loading a game from memory or the database
+    @return the game, or None if there is not one or it cannot be decoded
+    '''
+
+    # it is taken out of the cache as the request changes it, and only goes
+    # back once saved
+    entry = GAME_CACHE.pop(game_id)
+
+    # a game waiting to be saved is newer than the one in the database
+    data = None
+    version = None
+    if (None != GAME_WRITER):
+        data, version = GAME_WRITER.get(game_id) or (None, None)
+
+    if (None == data):
+        results = query_db("SELECT version FROM game WHERE ROWID = ?", [game_id], True)
+        if (None == results):
+            return None
+        version = results['version']
+
+    # a game cached by this worker is only current if nothing has saved it
+    # since, which the version saved with it tells us
+    g.game_version = version
+    if (None != entry and entry[0] == version):
+        return entry[1]
+
+    if (None == data):
+        results = query_db("SELECT data FROM game WHERE ROWID = ?", [game_id], True)
+        if (None == results or None == results['data']):
+            return None
+        data = results['data']
+
+    try:
+        return codec.decode_game(str(data))
+    except ValueError:
+        return None
+
+
+def save_game(a_game, a_round = None):
+    '''
+    Helper for saving a game in play, in the background if that is on and
+    otherwise right away, then keeping it in memory, as the next version of
+    the game loaded by the request
+    @param a_round round just finished, which is added to the game's rounds
+    '''
+
+    version = g.get('game_version', 0) + 1
+    values = [buffer(codec.encode_game(a_game)), a_game.score, a_game.rounds_completed(), version]
+    ended = encode_round(a_round) if None != a_round else None
+
+    if (None != GAME_WRITER):
+        GAME_WRITER.put(a_game.id, *values, ended = ended)
+
+    else:
+        begin_writes()
+        if (None != ended):
+            write_db(writer.WriteBehind.QUERY_ROUND, [a_game.id] + list(ended))
+        write_db(writer.WriteBehind.QUERY, values + [a_game.id])
+        commit_writes()
+
+    cache_game(a_game, version)
+
+
+def speculate_round(a_game):
+    '''
+    Helper for dealing the next round of a game in the background
+    '''
+
+    if (None == SPECULATOR):
+        return
+
+    if (0 < a_game.rounds_remaining()):
+        SPECULATOR.speculate(a_game.id, a_game.get_opponents())
+    else:
+        SPECULATOR.discard(a_game.id)
+
+
+def encode_round(a_round):
+    '''
+    Helper for encoding a finished round for the round table
+    @return id and encoding of the round
+    '''
+
+    return (a_round.id, buffer(codec.encode_round(a_round)))
+
+
+def cache_game(a_game, version):
+    '''
+    Helper for keeping a just saved game in memory, tagged with the version
+    it was saved as
+    '''
+
+    g.game_version = version
+    GAME_CACHE.set(a_game.id, (version, a_game))
+
+
+def offload(function, *args):
+    '''
+    Helper for running blocking work through OFFLOAD, if there is one.  The
+    work cannot touch the request context as it may run on another thread
+    @return what the function returns
+    '''
+
+    if (None == OFFLOAD):
+        return function(*args)
+
+    return OFFLOAD(function, args)
+
+
 def get_round_info(a_game):
     '''
     Helper for putting round info into an array
@@ -322,33 +612,78 @@ def get_round_info(a_game):
 ******************
 '''
 
+# Idle database connections, most recently used first
+DB_POOL = Queue.LifoQueue(DB_POOL_SIZE)
+
 def connect_db():
-    return sqlite3.connect(FILE_DATABASE)
+
+    # connections are handed between request threads through the pool, but
+    # only ever used by one at a time
+    db = sqlite3.connect(FILE_DATABASE
+                       , check_same_thread = False
+                       , cached_statements = DB_CACHED_STATEMENTS)
+
+    for pragma in DB_PRAGMAS:
+        db.execute(pragma)
+
+    return db
+
+def get_db():
+    try:
+        return DB_POOL.get_nowait()
+    except Queue.Empty:
+
+        # opening a connection and running its pragmas blocks like a query does
+        return offload(connect_db)
+
+def release_db(db):
+
+    # never hand out a connection in the middle of a transaction
+    offload(db.rollback)
+
+    try:
+        DB_POOL.put_nowait(db)
+    except Queue.Full:
+        offload(db.close)
 
 @app.before_request
 def before_request():
-    g.db = connect_db()
+    g.db = get_db()
 
 @app.teardown_request
 def teardown_request(exception):
     if hasattr(g, 'db'):
-        g.db.close()
+        release_db(g.db)
 
 def query_db(query, args = (), one = False):
-    cur = g.db.execute(query, args)
+    cur = offload(g.db.execute, query, args)
     rv = [dict((cur.description[idx][0], value)
-               for idx, value in enumerate(row)) for row in cur.fetchall()]
+               for idx, value in enumerate(row)) for row in offload(cur.fetchall)]
     return (rv[0] if rv else None) if one else rv
 
 def write_db(query, args = (), commit = True):
     
-    cur = g.db.execute(query, args)
+    cur = offload(g.db.execute, query, args)
     
-    if commit:
-        g.db.commit()
+    if commit and not g.get('db_batch'):
+        offload(g.db.commit)
 
     return cur.lastrowid
 
+def begin_writes():
+    '''
+    Holds back the commits of every write_db until commit_writes, so a
+    request's writes go to the database in a single transaction
+    '''
+    g.db_batch = True
+
+def commit_writes():
+    '''
+    Commits everything written since begin_writes
+    '''
+    g.db_batch = False
+    offload(g.db.commit)
+
 
 def init_db():
 
@@ -367,6 +702,63 @@ def init_db():
         except Exception as e:
            print 'Error creating dataabase: ' + e.strerror
 
+    else:
+        try:
+
+            # the schema only creates what is missing, so tables added since
+            # the database was created get added
+            with closing(connect_db()) as db:
+                with app.open_resource(FILE_SCHEMA) as f:
+                    db.cursor().executescript(f.read())
+
+                # only one worker fills in what is missing
+                db.execute("BEGIN IMMEDIATE")
+                add_columns(db)
+                fill_leaderboard(db)
+                fill_score_tree(db)
+                db.commit()
+
+        except Exception as e:
+           print 'Error updating database: ' + repr(e)
+
+
+def add_columns(db):
+    '''
+    Adds the columns the schema has gained since the database was created
+    '''
+
+    columns = [row[1] for row in db.execute("PRAGMA table_info(game)")]
+    if ('version' not in columns):
+        db.execute("ALTER TABLE game ADD COLUMN version INTEGER DEFAULT 0 NOT NULL")
+
+
+def fill_leaderboard(db):
+    '''
+    Fills an empty leaderboard from the completed games
+    '''
+
+    if (0 < db.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]):
+        return
+
+    for period in [0, get_interval_start()]:
+        db.execute("INSERT OR IGNORE INTO leaderboard (period, game_id, name, score) "
+                   "SELECT ?, ROWID, name, score FROM game WHERE completed = ? AND time_completed IS NOT NULL AND time_completed >= ? "
+                   "ORDER BY score DESC, ROWID LIMIT ?", [period, game.Game.ROUND_COUNT, period, LEADERBOARD_SIZE])
+
+
+def fill_score_tree(db):
+    '''
+    Fills an empty rank index from the completed games
+    '''
+
+    if (None != db.execute("SELECT node FROM score_tree LIMIT 1").fetchone()):
+        return
+
+    for period in [0, get_interval_start()]:
+        results = db.execute("SELECT score FROM game WHERE completed = ? AND time_completed IS NOT NULL AND time_completed >= ?"
+                           , [game.Game.ROUND_COUNT, period])
+        ranks.fill(db, period, (row[0] for row in results))
+
 
 '''
 ********************
@@ -374,13 +766,155 @@ def init_db():
 ********************
 '''
 
-# Database dealings
-FILE_DATABASE = DIR_TOP + '/database/data.db'
+# Database dealings, the database can be moved with HOWMANYOUTS_DATABASE (i.e. for benchmarks)
+FILE_DATABASE = os.environ.get('HOWMANYOUTS_DATABASE', DIR_TOP + '/database/data.db')
 FILE_SCHEMA = DIR_TOP + '/database/schema.sql'    
    
 init_db()
 
 
+'''
+********************
+    ROUND DEALER 
+********************
+'''
+
+def init_round_dealer():
+
+    # started before any other threads as the processes are forked
+    if 0 != ROUND_DEALER_PROCESSES:
+
+        game.ROUND_DEALER = dealer.ProcessDealer(ROUND_DEALER_PROCESSES, ROUND_DEALER_TIMEOUT)
+        game.ROUND_DEALER.start()
+        atexit.register(game.ROUND_DEALER.stop)
+
+init_round_dealer()
+
+
+'''
+********************
+    ROUND POOL 
+********************
+'''
+
+# Optional pre-dealt pool generated offline with pool.py
+FILE_ROUND_POOL = DIR_TOP + '/database/rounds.pool'
+
+def init_round_pool():
+
+    if 0 < ROUND_POOL_SIZE:
+
+        game.ROUND_POOL = pool.RoundPool(ROUND_POOL_SIZE, ROUND_POOL_LOW)
+
+        if os.path.exists(FILE_ROUND_POOL):
+            try:
+                game.ROUND_POOL.load(FILE_ROUND_POOL)
+            except Exception as e:
+                print 'Error loading round pool: ' + repr(e)
+
+        game.ROUND_POOL.start()
+
+init_round_pool()
+
+
+'''
+********************
+    SPECULATOR 
+********************
+'''
+
+# Next rounds of games dealt ahead of time, None when they are dealt when asked for
+SPECULATOR = None
+
+def init_speculator():
+
+    global SPECULATOR
+
+    if 0 < SPECULATE_SIZE:
+
+        SPECULATOR = speculate.Speculator(SPECULATE_SIZE, GAME_CACHE_TTL)
+        SPECULATOR.start()
+        atexit.register(SPECULATOR.stop)
+
+init_speculator()
+
+
+'''
+********************
+    GAME WRITER 
+********************
+'''
+
+# Games in play waiting to be saved, None when they are saved right away
+GAME_WRITER = None
+
+def init_game_writer():
+
+    global GAME_WRITER
+
+    if 0 < WRITE_BEHIND_WAIT:
+
+        GAME_WRITER = writer.WriteBehind(connect_db, WRITE_BEHIND_WAIT)
+        GAME_WRITER.start()
+        atexit.register(GAME_WRITER.stop)
+
+init_game_writer()
+
+
+'''
+********************
+    METRICS 
+********************
+'''
+
+# Functions timed when metrics are on, by owner, along with the timer names
+# for those not named after the function
+METRICS_TIMED = [(sys.modules[__name__], ['load_game', 'save_game', 'get_leader', 'commit_writes'
+                                        , ('query_db', 'db_read'), ('write_db', 'db_write')])
+               , (codec, ['decode_game', 'encode_game', 'encode_round'])
+               , (game.Game, ['new_round', 'deal_round'])
+               , (game.Round, ['deal', '_calc_outs', '_calc_flop_outs'])]
+
+def metrics_begin():
+    metrics.begin()
+
+def metrics_end(response):
+    timers, counters = metrics.end()
+    response.headers['Server-Timing'] = metrics.server_timing(timers, counters)
+    return response
+
+def metrics_discard(exception):
+
+    # a request that never made it to a response is not kept around
+    metrics.end()
+
+def init_metrics():
+
+    # every call to Round.deal is a deal, so its timer also counts the deals
+    # each round took.  Only work done on the request's own thread or greenlet
+    # makes it into the request's Server-Timing, offloaded work is only in the
+    # totals
+    if METRICS:
+
+        for owner, names in METRICS_TIMED:
+            for name in names:
+                if isinstance(name, tuple):
+                    metrics.instrument(owner, *name)
+                else:
+                    metrics.instrument(owner, name)
+
+        metrics.instrument_count(cards, 'evaluate', 'evaluations')
+        metrics.instrument_count(cards, 'evaluate_next', 'evaluations')
+        metrics.instrument_count(batch, 'partial_strengths', 'evaluations'
+                               , lambda partials, river: len(partials) * len(river))
+
+        app.before_request(metrics_begin)
+        app.after_request(metrics_end)
+        app.teardown_request(metrics_discard)
+
+init_metrics()
+
+
 '''
 ********************
     MAIN
@@ -0,0 +1,148 @@
+'''
+Timers and counters for the hot paths of dealing and playing rounds.
+
+Nothing is measured until functions are instrumented, which swaps them for
+wrappers timing or counting each call, so with instrumentation left off the
+code runs exactly as it would without this module.  Totals cover every
+thread, and the timings of the calls made on a request's own thread (or
+greenlet, when serving with gevent) between begin and end are also kept for
+that request.
+'''
+
+import threading
+import timeit
+
+# requests served by greenlets share a thread, so are told apart by greenlet
+try:
+    from greenlet import getcurrent as _current
+except ImportError:
+    from thread import get_ident as _current
+
+''' Function telling the time in seconds, as precisely as the platform can '''
+timer = timeit.default_timer
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_requests = {}
+
+def instrument(owner, attribute, name = None):
+    '''
+    Times every call of a function from now on
+    @param owner module or class holding the function
+    @param attribute name of the function in its owner
+    @param name name of the timer, defaults to the function's name
+    '''
+    function = getattr(owner, attribute)
+    name = name or attribute
+
+    def timed(*args, **kwargs):
+        started = timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, timer() - started)
+
+    _replace(owner, attribute, timed)
+
+def instrument_count(owner, attribute, name, amount = None):
+    '''
+    Counts every call of a function from now on
+    @param owner module or class holding the function
+    @param attribute name of the function in its owner
+    @param name name of the counter
+    @param amount function taking the call's arguments and returning how much
+                  to count, defaults to 1 for each call
+    '''
+    function = getattr(owner, attribute)
+
+    def counted(*args, **kwargs):
+        count(name, amount(*args, **kwargs) if None != amount else 1)
+        return function(*args, **kwargs)
+
+    _replace(owner, attribute, counted)
+
+def record(name, seconds):
+    '''
+    Adds a timing to a timer
+    @param name name of the timer
+    @param seconds time taken
+    '''
+    with _lock:
+        totals = _timers.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    request = _requests.get(_current())
+    if (None != request):
+        totals = request[0].setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+def count(name, amount = 1):
+    '''
+    Adds to a counter
+    @param name name of the counter
+    @param amount how much to add
+    '''
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+    request = _requests.get(_current())
+    if (None != request):
+        request[1][name] = request[1].get(name, 0) + amount
+
+def begin():
+    '''
+    Starts keeping the timings and counts of the calls made on this thread
+    or greenlet for a request
+    '''
+    _requests[_current()] = ({}, {}, timer())
+
+def end():
+    '''
+    Stops keeping the timings and counts for a request
+    @return dictionary of timer name to [calls, seconds] with a 'total' timer
+            for the whole request, and dictionary of counter name to count
+    '''
+    request = _requests.pop(_current(), None)
+    if (None == request):
+        return {}, {}
+
+    timers, counters, started = request
+    timers['total'] = [1, timer() - started]
+    return timers, counters
+
+def server_timing(timers, counters):
+    '''
+    @param timers timers of a request from end
+    @param counters counters of a request from end
+    @return value of a Server-Timing header for the request
+    '''
+    entries = ['%s;dur=%.3f;desc="%d calls"' % (name, seconds * 1000, calls)
+               for name, (calls, seconds) in sorted(timers.items())]
+    entries.extend(['%s;desc="%d"' % (name, amount) for name, amount in sorted(counters.items())])
+    return ', '.join(entries)
+
+def snapshot():
+    '''
+    @return totals so far as a dictionary of timers (name to calls, seconds
+            and mean milliseconds) and counters (name to count)
+    '''
+    with _lock:
+        timers = dict((name, {'calls' : calls, 'seconds' : seconds, 'mean_ms' : seconds * 1000 / calls})
+                      for name, (calls, seconds) in _timers.items())
+        counters = dict(_counters)
+
+    return {'timers' : timers, 'counters' : counters}
+
+# PRIVATE FUNCTIONS
+
+def _replace(owner, attribute, wrapper):
+    '''
+    Puts a wrapper in place of a function, keeping static methods static
+    '''
+    if (isinstance(getattr(owner, '__dict__', {}).get(attribute), staticmethod)):
+        wrapper = staticmethod(wrapper)
+
+    setattr(owner, attribute, wrapper)
@@ -0,0 +1,247 @@
+'''
+Checks candidate hand evaluators against the original list scanning
+Hand.make_legacy, over every seven card hand there is (133,784,560 of them)
+or over a stratified sample, spread across worker processes.
+
+make_legacy packs the made cards it picks into its strength, so a candidate
+agrees with it on both the ranking and the tie break order of a hand when
+their packed strengths are equal.  Disagreements are counted by the legacy
+ranking and by whether the ranking or only the kickers differ, with a few
+example hands for each.
+
+    python oracle.py [-c evaluate] [-p processes] [-n per stratum] [-s seed] [--exhaustive]
+'''
+
+import argparse
+import itertools
+import multiprocessing
+import random
+import sys
+
+import cards
+
+''' Candidate evaluators by name, each finding the packed strength of seven cards '''
+CANDIDATES = {'evaluate' : cards.evaluate
+            , 'partial'  : lambda seven: cards.evaluate_next(cards.evaluate_partial(seven[:6]), seven[6])
+            , 'add'      : lambda seven: cards.evaluate_next(cards.evaluate_add(cards.evaluate_partial(seven[:5]), seven[5]), seven[6])}
+
+''' Names of the hand rankings, indexed by ranking '''
+RANKING_NAMES = ['high card', 'pair', 'two pair', 'three of a kind', 'straight', 'flush'
+               , 'full house', 'four of a kind', 'straight flush', 'royal flush', 'five of a kind']
+
+''' Max number of example hands kept for each kind of disagreement '''
+EXAMPLES = 3
+
+''' Number of hands checked in each stratified job '''
+JOB_SIZE = 2000
+
+def _deal_ranking(ranking):
+    '''
+    @param ranking hand ranking
+    @return function dealing seven cards of the ranking from a random number generator
+    '''
+    return lambda rng: cards.deal_ranking(ranking, rng)
+
+def _deal_random(rng):
+    '''
+    @return seven random cards
+    '''
+    deck = cards.Deck()
+    deck.shuffle(rng)
+    return [deck.deal() for i in range(0, 7)]
+
+def _deal_ranks(ranks, rng, suit = None):
+    '''
+    Deals seven cards containing cards of the ranks given, of random suits
+    where they do not clash
+    @param ranks list of ranks that have to be in the hand
+    @param rng random number generator to deal with
+    @param suit suit all the cards of the ranks given are, None for any
+    @return list of seven cards
+    '''
+    deck = cards.Deck()
+    deck.shuffle(rng)
+
+    seven = []
+    for rank in ranks:
+        suits = [each for each in range(0, cards.Deck.SUIT_COUNT) if deck.contains(cards.Card(0, rank, each))]
+        card = cards.Card(0, rank, suit if None != suit else rng.choice(suits))
+        deck.remove([card])
+        seven.append(card)
+
+    while (len(seven) < 7):
+        seven.append(deck.deal())
+
+    rng.shuffle(seven)
+    return seven
+
+def _deal_wheel(rng):
+    '''
+    @return seven cards with an ace low straight
+    '''
+    return _deal_ranks([cards.Card.RANK_ACE, 2, 3, 4, 5], rng)
+
+def _deal_wheel_suited(rng):
+    '''
+    @return seven cards with an ace low straight flush
+    '''
+    return _deal_ranks([cards.Card.RANK_ACE, 2, 3, 4, 5], rng, rng.randint(0, cards.Deck.SUIT_COUNT - 1))
+
+def _deal_two_trips(rng):
+    '''
+    @return seven cards with two sets of trips
+    '''
+    ranks = rng.sample(range(2, cards.Card.RANK_ACE + 1), 2)
+    return _deal_ranks(ranks * 3, rng)
+
+def _deal_trips_two_pairs(rng):
+    '''
+    @return seven cards with trips and two pairs
+    '''
+    ranks = rng.sample(range(2, cards.Card.RANK_ACE + 1), 3)
+    return _deal_ranks(ranks[:1] * 3 + ranks[1:] * 2, rng)
+
+def _deal_three_pairs(rng):
+    '''
+    @return seven cards with three pairs
+    '''
+    ranks = rng.sample(range(2, cards.Card.RANK_ACE + 1), 3)
+    return _deal_ranks(ranks * 2, rng)
+
+''' Strata of the sample by name, each dealing seven cards from a random number generator '''
+STRATA = dict([(name.replace(' ', '_'), _deal_ranking(ranking))
+               for ranking, name in enumerate(RANKING_NAMES[:cards.Hand.RANKING_ROYAL_FLUSH + 1])])
+
+# plus the edge cases of the legacy code: the ace low straight, full houses
+# made from two sets of trips or with two pairs to pick from, three pairs and
+# hands dealt at random
+STRATA['wheel'] = _deal_wheel
+STRATA['wheel_suited'] = _deal_wheel_suited
+STRATA['two_trips'] = _deal_two_trips
+STRATA['trips_two_pairs'] = _deal_trips_two_pairs
+STRATA['three_pairs'] = _deal_three_pairs
+STRATA['random'] = _deal_random
+
+def check(candidate, hands):
+    '''
+    Checks a candidate evaluator against make_legacy
+    @param candidate name of the candidate in CANDIDATES
+    @param hands iterable of seven card hands
+    @return number of hands checked and dictionary of (legacy ranking, what
+            differed) to [count, example hands]
+    '''
+    evaluate = CANDIDATES[candidate]
+    count = 0
+    mismatches = {}
+
+    for seven in hands:
+        count += 1
+
+        hand = cards.Hand(seven[0], seven[1])
+        hand.make_legacy(seven[2:])
+        expected = hand.strength
+        strength = evaluate(seven)
+
+        if (expected != strength):
+
+            ranking = expected >> cards.STRENGTH_RANKING_SHIFT
+            differs = 'ranking' if ranking != strength >> cards.STRENGTH_RANKING_SHIFT else 'kickers'
+            entry = mismatches.setdefault((ranking, differs), [0, []])
+            entry[0] += 1
+            if (len(entry[1]) < EXAMPLES):
+                entry[1].append((' '.join([card.to_string() for card in seven]), expected, strength))
+
+    return count, mismatches
+
+def merge(total, result):
+    '''
+    Adds the result of a job to a running total
+    @param total [number of hands checked, mismatches] running total
+    @param result number of hands checked and mismatches from check
+    '''
+    count, mismatches = result
+    total[0] += count
+    for key, (found, examples) in mismatches.items():
+        entry = total[1].setdefault(key, [0, []])
+        entry[0] += found
+        entry[1].extend(examples[:EXAMPLES - len(entry[1])])
+
+def report(total):
+    '''
+    @param total [number of hands checked, mismatches] from merge
+    @return lines describing the mismatches
+    '''
+    lines = [str(total[0]) + ' hands checked, ' + str(sum([found for found, examples in total[1].values()])) + ' mismatches']
+    for (ranking, differs), (found, examples) in sorted(total[1].items()):
+        lines.append('  ' + RANKING_NAMES[ranking] + ', ' + differs + ' differ: ' + str(found))
+        for seven, expected, strength in examples:
+            lines.append('    ' + seven + '  legacy ' + _describe(expected) + '  candidate ' + _describe(strength))
+
+    return lines
+
+# JOBS
+
+def _exhaustive_job(job):
+    '''
+    Checks every seven card hand starting with two given cards, in CARDS order
+    @param job (candidate name, index of the first card, index of the second card)
+    '''
+    candidate, first, second = job
+    head = [cards.CARDS[first], cards.CARDS[second]]
+    hands = (head + list(rest) for rest in itertools.combinations(cards.CARDS[second + 1:], 5))
+    return check(candidate, hands)
+
+def _stratified_job(job):
+    '''
+    Checks hands dealt from a stratum
+    @param job (candidate name, stratum name, seed, number of hands)
+    '''
+    candidate, stratum, seed, count = job
+    rng = random.Random(seed)
+    deal = STRATA[stratum]
+    return check(candidate, (deal(rng) for i in range(0, count)))
+
+def _describe(strength):
+    '''
+    @return packed strength as its ranking and made card ranks
+    '''
+    ranking, ranks = cards.unpack_strength(strength)
+    return RANKING_NAMES[ranking] + str(ranks)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'Checks hand evaluators against the legacy Hand.make')
+    parser.add_argument('-c', '--candidate', default = 'evaluate', choices = sorted(CANDIDATES.keys()), help = 'evaluator to check')
+    parser.add_argument('-p', '--processes', type = int, default = None, help = 'number of worker processes, defaults to the number of cores')
+    parser.add_argument('-n', '--count', type = int, default = 20000, help = 'hands checked from each stratum')
+    parser.add_argument('-s', '--seed', type = int, default = 1, help = 'seed of the sample')
+    parser.add_argument('--exhaustive', action = 'store_true', help = 'check every seven card hand instead of a sample')
+    args = parser.parse_args()
+
+    if (args.exhaustive):
+        jobs = [(args.candidate, first, second) for first in range(0, cards.Deck.CARD_COUNT)
+                                                for second in range(first + 1, cards.Deck.CARD_COUNT - 5)]
+        work = _exhaustive_job
+
+    else:
+        jobs = []
+        for stratum in sorted(STRATA.keys()):
+            for start in range(0, args.count, JOB_SIZE):
+                jobs.append((args.candidate, stratum, '%d %s %d' % (args.seed, stratum, start), min(JOB_SIZE, args.count - start)))
+        work = _stratified_job
+
+    total = [0, {}]
+    pool = multiprocessing.Pool(args.processes)
+    for done, result in enumerate(pool.imap_unordered(work, jobs)):
+        merge(total, result)
+        sys.stderr.write('\r' + str(done + 1) + '/' + str(len(jobs)) + ' jobs')
+
+    pool.close()
+    pool.join()
+    sys.stderr.write('\n')
+
+    for line in report(total):
+        print line
+
+    sys.exit(1 if total[1] else 0)
@@ -0,0 +1,347 @@
+import atexit
+import random
+import struct
+import sys
+import threading
+import zlib
+
+import codec
+import game
+
+class RoundPool:
+    '''
+    Pool of pre-dealt rounds, bucketed by number of opponents and number of
+    outs, so starting a new round is a draw instead of dealing and
+    calculating outs (possibly a few times over) during a request.
+
+    Rounds are drawn from the out buckets with the same distribution
+    Game.new_round gets by dealing again on common outs, so rounds that would
+    have been thrown away are kept for later instead.  A worker thread deals
+    more rounds whenever the pool runs low.
+    '''
+
+    ''' Number of opponents rounds are dealt for '''
+    OPPONENTS = [1, 2, 3]
+
+    ''' How much bigger than its share of the pool a single outs bucket can grow '''
+    BUCKET_SLACK = 2
+
+    ''' Max number of seconds the worker sleeps between checking the pool '''
+    REFILL_WAIT = 5
+
+    ''' Marks a file as a saved pool '''
+    MAGIC = 'HMP'
+
+    ''' Version of the saved pool layout '''
+    VERSION = 1
+
+    _HEADER = struct.Struct('<3sBII')
+    _SEEN = struct.Struct('<BBI')
+
+    def __init__(self, size = 200, low = 50):
+        '''
+        Constructs a new empty pool
+        @param size number of rounds to keep for each number of opponents
+        @param low number of rounds left for a number of opponents that wakes up the worker
+        '''
+        self._size = size
+        self._low = low
+
+        self._buckets = dict((opponents, {}) for opponents in RoundPool.OPPONENTS)
+        self._counts = dict((opponents, 0) for opponents in RoundPool.OPPONENTS)
+        self._seen = dict((opponents, {}) for opponents in RoundPool.OPPONENTS)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self._exit_registered = False
+
+    def deal(self, opponents):
+        '''
+        Deals a new round into the pool
+        @param opponents number of opponent hands to deal
+        @return True if the round was kept, False if its bucket was full
+        '''
+        a_round = game.Round(0)
+        a_round.deal(opponents)
+        outs = len(a_round.outs)
+
+        with self._lock:
+
+            seen = self._seen[opponents]
+            seen[outs] = seen.get(outs, 0) + 1
+
+            bucket = self._buckets[opponents].setdefault(outs, [])
+            share = self._target(opponents).get(outs, 0)
+            if (len(bucket) >= int(share * self._size * RoundPool.BUCKET_SLACK) + 1):
+                return False
+
+            bucket.append(a_round)
+            self._counts[opponents] += 1
+
+        return True
+
+    def fill(self, opponents = None):
+        '''
+        Deals rounds until the pool is full
+        @param opponents number of opponents to fill for, defaults to all
+        '''
+        for count in ([opponents] if None != opponents else RoundPool.OPPONENTS):
+            while (self._running or None == self._thread) and self.count(count) < self._size:
+                self.deal(count)
+
+    def draw(self, opponents):
+        '''
+        Draws a round from the pool, picking the number of outs the same way
+        dealing again on common outs would
+        @param opponents number of opponents in the round
+        @return dealt round or None if the pool cannot supply one
+        '''
+        a_round = None
+
+        with self._lock:
+
+            target = self._target(opponents)
+            pick = random.random()
+            for outs, share in sorted(target.items()):
+                pick -= share
+                if (0 >= pick):
+                    bucket = self._buckets[opponents].get(outs)
+                    if (bucket):
+                        a_round = bucket.pop()
+                        self._counts[opponents] -= 1
+                    break
+
+            low = self._counts[opponents] < self._low
+
+        if (low):
+            self._wake.set()
+
+        return a_round
+
+    def count(self, opponents):
+        '''
+        @param opponents number of opponents
+        @return number of rounds in the pool for the number of opponents
+        '''
+        return self._counts[opponents]
+
+    def start(self):
+        '''
+        Starts a worker thread that keeps the pool full, which is stopped
+        before the interpreter exits
+        '''
+        if (None != self._thread):
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target = self._refill)
+        self._thread.daemon = True
+        self._thread.start()
+
+        if (not self._exit_registered):
+            self._exit_registered = True
+            atexit.register(self.stop)
+
+    def stop(self):
+        '''
+        Stops the worker thread
+        '''
+        if (None == self._thread):
+            return
+
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def save(self, path):
+        '''
+        Saves the pool to a file: a header, how often each number of outs has
+        been seen, then every round encoded with codec.encode_round, all
+        compressed
+        @param path file to save to
+        '''
+        with self._lock:
+
+            seen = [RoundPool._SEEN.pack(opponents, outs, count)
+                    for opponents in RoundPool.OPPONENTS for outs, count in sorted(self._seen[opponents].items())]
+            rounds = [codec.encode_round(a_round)
+                      for opponents in RoundPool.OPPONENTS
+                      for outs, bucket in sorted(self._buckets[opponents].items()) for a_round in bucket]
+
+        header = RoundPool._HEADER.pack(RoundPool.MAGIC, RoundPool.VERSION, len(seen), len(rounds))
+        with open(path, 'wb') as f:
+            f.write(zlib.compress(header + ''.join(seen) + ''.join(rounds)))
+
+    def load(self, path):
+        '''
+        Adds the rounds from a saved pool file to the pool
+        @param path file to load from
+        @raise ValueError if the file is not a pool this version can read
+        '''
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        try:
+            data = zlib.decompress(data)
+            magic, version, count_seen, count_rounds = RoundPool._HEADER.unpack_from(data, 0)
+            if (RoundPool.MAGIC != magic or RoundPool.VERSION != version):
+                raise ValueError('Not a saved pool or unknown version')
+
+            offset = RoundPool._HEADER.size
+            seen = []
+            for i in range(0, count_seen):
+                seen.append(RoundPool._SEEN.unpack_from(data, offset))
+                offset += RoundPool._SEEN.size
+
+            rounds = []
+            for i in range(0, count_rounds):
+                a_round, offset = codec.decode_round(data, offset)
+                rounds.append(a_round)
+
+        except (zlib.error, struct.error) as e:
+            raise ValueError('Bad pool file: ' + str(e))
+
+        with self._lock:
+
+            for opponents, outs, count in seen:
+                if (opponents in self._seen):
+                    self._seen[opponents][outs] = self._seen[opponents].get(outs, 0) + count
+
+            for a_round in rounds:
+                opponents = len(a_round.get_hands()) - 1
+                if (opponents in self._buckets):
+                    self._buckets[opponents].setdefault(len(a_round.outs), []).append(a_round)
+                    self._counts[opponents] += 1
+
+    # PRIVATE METHODS
+
+    def _target(self, opponents):
+        '''
+        Works out the share of rounds each number of outs should get, by
+        playing Game.should_redeal against how often each number of outs has
+        been dealt
+        @param opponents number of opponents
+        @return dictionary of outs to share of rounds
+        '''
+        seen = self._seen[opponents]
+        total = float(sum(seen.values()))
+
+        target = {}
+        if (0 == total):
+            return target
+
+        # chance of reaching each deal, keeping what that deal would not redeal
+        reach = 1.0
+        iterations = 1
+        while (0 < reach):
+
+            redeal = 0
+            for outs, count in seen.items():
+                chance = count / total
+                if (game.Game.should_redeal(opponents, outs, iterations)):
+                    redeal += chance
+                else:
+                    target[outs] = target.get(outs, 0) + reach * chance
+
+            reach *= redeal
+            iterations += 1
+
+        return target
+
+    def _refill(self):
+        '''
+        Worker loop keeping the pool full until stopped
+        '''
+        while (self._running):
+            self.fill()
+            self._wake.wait(RoundPool.REFILL_WAIT)
+            self._wake.clear()
+
+
+if __name__ == "__main__" and 1 < len(sys.argv):
+
+    '''
+    Pre-deals a pool offline:  python pool.py <file> [size]
+    '''
+
+    path = sys.argv[1]
+    size = int(sys.argv[2]) if 2 < len(sys.argv) else 1000
+
+    pool = RoundPool(size)
+    pool.fill()
+    pool.save(path)
+
+    for opponents in RoundPool.OPPONENTS:
+        print str(opponents) + ' ' + str(pool.count(opponents))
+
+elif __name__ == "__main__":
+
+    '''
+    Checks the pool against dealing inline:  python pool.py
+    '''
+
+    import os
+    import tempfile
+
+    random.seed(1)
+
+    # outs grouped so the number of draws needed stays small, with the
+    # common outs dealt again on their own
+    groups = [[0], [1, 2], [3], [4, 5], [6], [7, 8, 9], range(10, 15)]
+
+    def shares(outs):
+        counts = [0] * (len(groups) + 1)
+        for count in outs:
+            counts[([i for i, group in enumerate(groups) if count in group] or [len(groups)])[0]] += 1
+        return [count / float(len(outs)) for count in counts]
+
+    pool = RoundPool(2000)
+    samples = 1500
+    for opponents in [1, 3]:
+
+        pool.fill(opponents)
+
+        # the share of each number of outs adds up, and dealing again makes
+        # the common outs rarer than they are dealt
+        target = pool._target(opponents)
+        seen = pool._seen[opponents]
+        total = float(sum(seen.values()))
+        print str(opponents) + 'a ' + str(abs(1 - sum(target.values())) < .001) \
+            + ' ' + str(target.get(0, 0) < seen.get(0, 0) / total)
+
+        # draws, dealing inline whenever a bucket runs out like Game.supply_round,
+        # are distributed the same as dealing inline
+        drawn = []
+        for i in range(0, samples):
+            a_round = pool.draw(opponents) or game.Game.deal_round(opponents)
+            drawn.append(len(a_round.outs))
+        dealt = [len(game.Game.deal_round(opponents).outs) for i in range(0, samples)]
+
+        distance = sum([abs(a - b) for a, b in zip(shares(drawn), shares(dealt))]) / 2
+        print str(opponents) + 'b ' + str(distance < .08) + ' ' + str(round(distance, 3))
+
+    # a saved pool loads back the same
+    path = os.path.join(tempfile.mkdtemp(), 'rounds.pool')
+    pool.save(path)
+    loaded = RoundPool(2000)
+    loaded.load(path)
+    print '2 ' + str(all([pool.count(opponents) == loaded.count(opponents) for opponents in RoundPool.OPPONENTS])) \
+        + ' ' + str(pool._seen == loaded._seen) + ' ' + str(pool._target(1) == loaded._target(1))
+
+    copy = path + '.copy'
+    loaded.save(copy)
+    with open(path, 'rb') as f:
+        with open(copy, 'rb') as f_copy:
+            print '3 ' + str(f.read() == f_copy.read())
+
+    # anything else is refused
+    with open(copy, 'wb') as f:
+        f.write(zlib.compress('HMP' + chr(RoundPool.VERSION + 1) + '\0' * 8))
+    try:
+        loaded.load(copy)
+        print '4 False'
+    except ValueError:
+        print '4 True'
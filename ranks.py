@@ -0,0 +1,136 @@
+'''
+Rank index over completed game scores, kept in the score_tree table as one
+Fenwick tree per leaderboard period (0 for all time, otherwise the start of
+the interval).  Adding a score or counting the scores that beat a score
+each touch at most SCORE_BITS rows, however many games have been played.
+
+Node 0 of each tree holds the number of scores in the period.
+'''
+
+''' Number of bits covering every possible score '''
+SCORE_BITS = 20
+
+''' Highest position in a tree, scores past it share the last position '''
+SCORE_MAX = (1 << SCORE_BITS) - 1
+
+def _position(score):
+    '''
+    @param score game score
+    @return 1 based tree position of the score
+    '''
+    return min(max(int(score), 0), SCORE_MAX - 1) + 1
+
+def _update_nodes(score):
+    '''
+    @param score game score
+    @return tree nodes that count the score
+    '''
+    nodes = [0]
+    pos = _position(score)
+    while (pos <= SCORE_MAX):
+        nodes.append(pos)
+        pos += pos & -pos
+
+    return nodes
+
+def _prefix_nodes(score):
+    '''
+    @param score game score
+    @return tree nodes that add up to the number of scores at or below the score
+    '''
+    nodes = []
+    if (score < 0):
+        return nodes
+
+    pos = _position(score)
+    while (0 < pos):
+        nodes.append(pos)
+        pos -= pos & -pos
+
+    return nodes
+
+def add_score(db, period, score):
+    '''
+    Adds a completed game's score to a period's tree, without committing
+    @param db database connection
+    @param period 0 for all time, otherwise the start of the interval
+    @param score game score
+    '''
+    nodes = [[period, node] for node in _update_nodes(score)]
+    db.executemany("INSERT OR IGNORE INTO score_tree (period, node) VALUES (?, ?)", nodes)
+    db.executemany("UPDATE score_tree SET count = count + 1 WHERE period = ? AND node = ?", nodes)
+
+def count_above(db, period, score):
+    '''
+    @param db database connection
+    @param period 0 for all time, otherwise the start of the interval
+    @param score game score
+    @return number of scores in the period higher than the score
+    '''
+    nodes = _prefix_nodes(score)
+    row = db.execute("SELECT SUM(CASE WHEN node = 0 THEN count ELSE -count END) FROM score_tree "
+                     "WHERE period = ? AND node IN (" + ', '.join(['0'] + ['?'] * len(nodes)) + ")"
+                   , [period] + nodes).fetchone()
+
+    return int(row[0] or 0)
+
+def fill(db, period, scores):
+    '''
+    Builds a period's tree from scratch, without committing
+    @param db database connection
+    @param period 0 for all time, otherwise the start of the interval
+    @param scores iterable of the scores in the period
+    '''
+    counts = {}
+    for score in scores:
+        for node in _update_nodes(score):
+            counts[node] = counts.get(node, 0) + 1
+
+    db.execute("DELETE FROM score_tree WHERE period = ?", [period])
+    db.executemany("INSERT INTO score_tree (period, node, count) VALUES (?, ?, ?)"
+                 , [[period, node, count] for node, count in counts.items()])
+
+
+if __name__ == "__main__":
+
+    import os
+    import random
+    import sqlite3
+
+    db = sqlite3.connect(':memory:')
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema.sql')) as f:
+        db.executescript(f.read())
+    db.execute("CREATE TABLE scores (period INTEGER, score INTEGER)")
+
+    # scores in steps of points so there are plenty of ties, along with
+    # scores past either end of the tree
+    random.seed(1)
+    scores = [random.randint(0, 40) * 5000 for i in range(0, 500)]
+    scores.extend([0, 0, -5, SCORE_MAX - 1, SCORE_MAX, SCORE_MAX + 1, SCORE_MAX * 3])
+
+    # period 1 is built a score at a time, period 2 all at once, period 3 is empty
+    for score in scores:
+        add_score(db, 1, score)
+        db.execute("INSERT INTO scores (period, score) VALUES (1, ?)", [score])
+        db.execute("INSERT INTO scores (period, score) VALUES (2, ?)", [score])
+    fill(db, 2, scores)
+
+    # scores past the ends of the tree count the same as the ends, and every
+    # score is above a negative one
+    def brute(period, score):
+        clamp = min(score, SCORE_MAX - 1)
+        return db.execute("SELECT COUNT(*) FROM scores WHERE period = ? AND MIN(MAX(score, 0), ?) > ?"
+                        , [period, SCORE_MAX - 1, clamp]).fetchone()[0]
+
+    queries = sorted(set(scores + [score + 1 for score in scores] + [score - 1 for score in scores]))
+    print '0 ' + str(all([brute(1, score) == count_above(db, 1, score) for score in queries]))
+    print '1 ' + str(all([brute(2, score) == count_above(db, 2, score) for score in queries]))
+    print '2 ' + str(all([0 == count_above(db, 3, score) for score in queries]))
+
+    # ties never beat each other, and nothing beats the top score
+    print '3 ' + str(len([score for score in scores if score > 5000]) == count_above(db, 1, 5000))
+    print '4 ' + str(0 == count_above(db, 1, SCORE_MAX * 3)) + ' ' + str(len(scores) == count_above(db, 1, -1))
+
+    # both ways of building a period make the same tree
+    print '5 ' + str(db.execute("SELECT node, count FROM score_tree WHERE period = 1 AND count > 0 ORDER BY node").fetchall()
+                  == db.execute("SELECT node, count FROM score_tree WHERE period = 2 AND count > 0 ORDER BY node").fetchall())
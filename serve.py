@@ -0,0 +1,31 @@
+'''
+Serves the game from a single process with gevent, holding many players at
+once on greenlets instead of a thread each.  Dealing rounds and database
+calls, including opening new database connections, are handed to a small
+pool of threads so they do not hold up the other players in the meantime.
+
+    pip install gevent
+    python serve.py [port]
+'''
+
+import sys
+
+from gevent.pywsgi import WSGIServer
+from gevent.threadpool import ThreadPool
+
+import howmanyouts
+
+''' Number of threads running blocking work '''
+THREADS = 8
+
+''' Port served on by default '''
+PORT = 5000
+
+if __name__ == "__main__":
+
+    port = int(sys.argv[1]) if 1 < len(sys.argv) else PORT
+
+    pool = ThreadPool(THREADS)
+    howmanyouts.OFFLOAD = pool.apply
+
+    WSGIServer(('', port), howmanyouts.app).serve_forever()
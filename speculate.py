@@ -0,0 +1,127 @@
+import Queue
+import threading
+
+import cache
+import game
+
+class Speculator:
+    '''
+    Deals the next round of games in the background while their players are
+    still looking at the current one, so the round is ready when asked for.
+
+    The next round's number of opponents depends on the guess, so a round is
+    dealt for the current number of opponents once the current round is
+    dealt, then dealt again if the guess changes the number of opponents.  A
+    round dealt for the wrong number of opponents is simply thrown away.
+    '''
+
+    ''' Max number of seconds the worker sleeps between checking it is still running '''
+    WAIT = 5
+
+    def __init__(self, size = 1000, ttl = None):
+        '''
+        Constructs a new speculator, not dealing anything until started
+        @param size max number of games to keep a next round for
+        @param ttl seconds a next round is kept without being taken, None keeps it forever
+        '''
+        self._rounds = cache.LRUCache(size, ttl)
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def speculate(self, game_id, opponents):
+        '''
+        Starts dealing the next round of a game, unless it is already being
+        dealt for the same number of opponents
+        @param game_id game to deal the round for
+        @param opponents number of opponents the round is expected to have
+        '''
+        with self._lock:
+            entry = self._rounds.get(game_id)
+            if (None != entry and opponents == entry[0]):
+                return
+
+            self._rounds.set(game_id, (opponents, None))
+
+        self._queue.put((game_id, opponents))
+
+    def take(self, game_id, opponents):
+        '''
+        Takes the next round of a game if it is ready
+        @param game_id game the round is for
+        @param opponents number of opponents the round needs
+        @return the round, or None if there is not one ready with that many opponents
+        '''
+        with self._lock:
+            entry = self._rounds.get(game_id)
+            self._rounds.remove(game_id)
+
+        if (None == entry or opponents != entry[0]):
+            return None
+
+        return entry[1]
+
+    def discard(self, game_id):
+        '''
+        Throws away the next round of a game, for when there will not be one
+        @param game_id game to throw the round away for
+        '''
+        with self._lock:
+            self._rounds.remove(game_id)
+
+    def start(self):
+        '''
+        Starts a worker thread dealing the next rounds
+        '''
+        if (None != self._thread):
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target = self._deal)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stops the worker thread
+        '''
+        if (None == self._thread):
+            return
+
+        self._running = False
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    # PRIVATE METHODS
+
+    def _deal(self):
+        '''
+        Worker loop dealing the next rounds asked for until stopped
+        '''
+        while (self._running):
+
+            try:
+                job = self._queue.get(True, Speculator.WAIT)
+            except Queue.Empty:
+                continue
+
+            if (None == job):
+                continue
+
+            # nothing to do if the round has since been taken or is wanted
+            # with a different number of opponents
+            game_id, opponents = job
+            if ((opponents, None) != self._rounds.get(game_id)):
+                continue
+
+            try:
+                a_round = game.Game.supply_round(opponents)
+            except Exception as e:
+                print 'Error dealing next round: ' + repr(e)
+                continue
+
+            with self._lock:
+                if ((opponents, None) == self._rounds.get(game_id)):
+                    self._rounds.set(game_id, (opponents, a_round))
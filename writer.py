@@ -0,0 +1,246 @@
+import threading
+from contextlib import closing
+
+class WriteBehind:
+    '''
+    Queue of game states waiting to be written to the database by a worker
+    thread, so saving a game in the middle of play does not hold up the
+    request.  Only the newest state of each game is kept, however many times
+    it was saved while waiting, along with every round finished meanwhile,
+    and every wait the worker writes all of them in one transaction.
+
+    Games are never marked completed through the queue, and a queued state
+    is not written over a game that has been completed since.
+    '''
+
+    ''' Writes a queued game state '''
+    QUERY = "UPDATE game SET data = ?, score = ?, completed = ?, version = ? WHERE ROWID = ? AND time_completed IS NULL"
+
+    ''' Writes a finished round '''
+    QUERY_ROUND = "INSERT OR REPLACE INTO round (game_id, id, data) VALUES (?, ?, ?)"
+
+    def __init__(self, connect, wait = 2):
+        '''
+        Constructs a new empty queue
+        @param connect function returning a new database connection
+        @param wait max number of seconds a game state waits to be written
+        '''
+        self._connect = connect
+        self._wait = wait
+
+        self._pending = {}
+        self._rounds = {}
+        self._flushing_states = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def put(self, game_id, data, score, completed, version, ended = None):
+        '''
+        Queues a game state, replacing any state of the game already waiting
+        @param game_id game the state is for
+        @param data encoded game
+        @param score score of the game
+        @param completed number of rounds completed
+        @param version version the game is saved as
+        @param ended id and encoding of a round just finished, if there is one
+        '''
+        with self._lock:
+            self._pending[game_id] = (data, score, completed, version)
+            if (None != ended):
+                self._rounds.setdefault(game_id, []).append(ended)
+
+    def get(self, game_id):
+        '''
+        @param game_id game to look for
+        @return encoded game waiting to be written or being written and the
+                version it is saved as, or None if there is not one
+        '''
+        with self._lock:
+            pending = self._pending.get(game_id) or self._flushing_states.get(game_id)
+
+        return (pending[0], pending[3]) if None != pending else None
+
+    def discard(self, game_id):
+        '''
+        Drops a waiting game state, for when a newer one is written directly
+        @param game_id game to drop
+        @return list of ids and encodings of the finished rounds that were
+                waiting, which are then up to the caller to write
+        '''
+        with self._lock:
+            self._pending.pop(game_id, None)
+            self._flushing_states.pop(game_id, None)
+            return self._rounds.pop(game_id, [])
+
+    def count(self):
+        '''
+        @return number of game states waiting
+        '''
+        return len(self._pending)
+
+    def flush(self):
+        '''
+        Writes every waiting game state in one transaction, the states being
+        written are still found by get until they are committed
+        '''
+        with self._flushing:
+
+            with self._lock:
+                pending = self._pending
+                rounds = self._rounds
+                self._flushing_states = dict(pending)
+                self._pending = {}
+                self._rounds = {}
+
+            if (0 == len(pending) and 0 == len(rounds)):
+                return
+
+            try:
+                with closing(self._connect()) as db:
+                    db.executemany(WriteBehind.QUERY_ROUND, [[game_id, id, data]
+                                                            for game_id, ended in rounds.items() for id, data in ended])
+                    db.executemany(WriteBehind.QUERY, [[data, score, completed, version, game_id]
+                                                      for game_id, (data, score, completed, version) in pending.items()])
+                    db.commit()
+
+            except Exception:
+
+                # put back what failed to write, unless newer states have been
+                # queued or the game discarded since
+                with self._lock:
+                    for game_id, values in pending.items():
+                        if (game_id in self._flushing_states):
+                            self._pending.setdefault(game_id, values)
+                    for game_id, ended in rounds.items():
+                        self._rounds[game_id] = ended + self._rounds.get(game_id, [])
+                    self._flushing_states = {}
+                raise
+
+            with self._lock:
+                self._flushing_states = {}
+
+    def start(self):
+        '''
+        Starts a worker thread that writes waiting game states
+        '''
+        if (None != self._thread):
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target = self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stops the worker thread, writing anything still waiting
+        '''
+        if (None != self._thread):
+            self._running = False
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    # PRIVATE METHODS
+
+    def _write(self):
+        '''
+        Worker loop writing waiting game states until stopped
+        '''
+        while (self._running):
+            self._wake.wait(self._wait)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception as e:
+                print 'Error writing games: ' + repr(e)
+
+
+if __name__ == "__main__":
+
+    import os
+    import sqlite3
+
+    db = sqlite3.connect(':memory:')
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema.sql')) as f:
+        db.executescript(f.read())
+    db.executemany("INSERT INTO game (ROWID, name, time_start) VALUES (?, 'Anon', 0)", [[1], [2]])
+    db.commit()
+
+    # run just before each commit
+    before_commit = None
+
+    class Connection:
+        '''
+        The one in-memory database, kept open between flushes
+        '''
+        def executemany(self, query, args):
+            return db.executemany(query, args)
+
+        def commit(self):
+            if (None != before_commit):
+                before_commit()
+            db.commit()
+
+        def close(self):
+            db.rollback()
+
+    def row(game_id):
+        return db.execute("SELECT data, score, completed, version FROM game WHERE ROWID = ?", [game_id]).fetchone()
+
+    queue = WriteBehind(Connection)
+
+    # repeated saves of a game are written once, as the newest state, along
+    # with every round finished meanwhile
+    queue.put(1, 'a', 10, 1, 1, ended = (1, 'r1'))
+    queue.put(1, 'b', 20, 2, 2, ended = (2, 'r2'))
+    queue.put(1, 'c', 30, 2, 3)
+    print '0 ' + str(1 == queue.count()) + ' ' + str(('c', 3) == queue.get(1))
+
+    # a state being written is still there to get until it is committed
+    seen = []
+    before_commit = lambda: seen.append(queue.get(1))
+    queue.flush()
+    before_commit = None
+    print '1 ' + str([('c', 3)] == seen) + ' ' + str(None == queue.get(1)) + ' ' + str(0 == queue.count())
+    print '2 ' + str((u'c', 30, 2, 3) == tuple(row(1))) \
+        + ' ' + str(2 == db.execute("SELECT COUNT(*) FROM round WHERE game_id = 1").fetchone()[0])
+
+    # a failed write is queued again, unless a newer state came in meanwhile
+    def fail():
+        queue.put(2, 'newer', 60, 3, 6)
+        raise sqlite3.OperationalError('database is locked')
+
+    queue.put(1, 'd', 40, 3, 4, ended = (3, 'r3'))
+    queue.put(2, 'e', 50, 2, 5)
+    before_commit = fail
+    try:
+        queue.flush()
+        print '3 False'
+    except sqlite3.OperationalError:
+        print '3 ' + str(('d', 4) == queue.get(1)) + ' ' + str(('newer', 6) == queue.get(2)) \
+            + ' ' + str((u'c', 30, 2, 3) == tuple(row(1)))
+    before_commit = None
+
+    queue.flush()
+    print '4 ' + str((u'd', 40, 3, 4) == tuple(row(1))) + ' ' + str((u'newer', 60, 3, 6) == tuple(row(2))) \
+        + ' ' + str(3 == db.execute("SELECT COUNT(*) FROM round WHERE game_id = 1").fetchone()[0])
+
+    # a discarded game hands back its rounds and is not written
+    queue.put(2, 'f', 70, 4, 7, ended = (4, 'r4'))
+    print '5 ' + str([(4, 'r4')] == queue.discard(2)) + ' ' + str(None == queue.get(2))
+    queue.flush()
+    print '6 ' + str((u'newer', 60, 3, 6) == tuple(row(2)))
+
+    # a queued state never goes over a game completed since
+    db.execute("UPDATE game SET data = 'final', time_completed = 1 WHERE ROWID = 1")
+    db.commit()
+    queue.put(1, 'late', 80, 5, 8)
+    queue.flush()
+    print '7 ' + str(u'final' == row(1)[0])